@@ -0,0 +1,69 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""Check that calimu's modules import within a time budget, and without pulling in modules they shouldn't.
+
+Each module is imported in a fresh interpreter with -X importtime, a few times, and the fastest cumulative time counts.
+Exits with 1 if any module goes over its budget or imports a forbidden module.
+
+    python benchmarks/import_time.py [--runs 5] [--scale 1.0]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+HEADLESS_FORBIDDEN = ("sklearn", "vtk", "vtkmodules", "svtk", "tkinter")
+
+# module: (budget in ms, modules it mustn't import)
+BUDGETS = {
+    "calimu.pcl_algo.fit": (600, HEADLESS_FORBIDDEN),
+    "calimu.pcl_algo.pipeline": (700, HEADLESS_FORBIDDEN),
+    "calimu.imu.store": (700, HEADLESS_FORBIDDEN),
+    "calimu.session": (800, HEADLESS_FORBIDDEN),
+    "calimu.cli": (800, HEADLESS_FORBIDDEN),
+    # the gui needs tkinter, but vtk should wait until the window is up
+    "calimu.gui": (1000, ("sklearn", "vtk", "vtkmodules", "svtk")),
+}
+
+_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module):
+    """Cumulative import time of module in ms, and every module that got imported along with it."""
+    code = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_REPO, os.environ.get("PYTHONPATH")])))
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env, check=True
+    )
+    cumulative = None
+    for line in p.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module and not parts[2].startswith("  "):
+            cumulative = int(parts[1]) / 1000.0
+    return cumulative, set(p.stdout.split())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="imports per module, the fastest one counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget, for slow machines")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module, (budget, forbidden) in BUDGETS.items():
+        budget *= args.scale
+        runs = [measure(module) for _ in range(args.runs)]
+        best = min(t for t, _ in runs)
+        loaded = runs[0][1]
+        bad = sorted(m for m in loaded if m.split(".")[0] in forbidden)
+        ok = best <= budget and not bad
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {module:28} {best:8.1f} ms / {budget:.0f} ms")
+        if bad:
+            print(f"     imports {', '.join(sorted({m.split('.')[0] for m in bad}))}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""Aggregate throughput of gathering from many emulated IMUs, with MultiIMUReader or with a thread per device.
+
+Every device is a pseudo terminal that one feeder process keeps full of emulated MC6470 text, as fast as it's read, so
+the numbers are what the reading side can keep up with, and the cpu column is only the reading side. Not on windows,
+since it needs ptys and fork.
+
+    python benchmarks/multi_device.py [--devices 1,8,32,64] [--duration 3]
+"""
+
+import argparse
+import multiprocessing
+import os
+import select
+import sys
+import threading
+import time
+import tty
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calimu.imu.devices.emulator import MC6470Emulator  # noqa: E402
+from calimu.imu.devices.mc6470 import MC6470IMU  # noqa: E402
+from calimu.imu.multi import MultiIMUReader  # noqa: E402
+from calimu.imu.store import IMUPointStore  # noqa: E402
+
+
+class PtyFeeder(object):
+    """n ptys, all fed the same looping chunk of emulated samples by one forked process, as fast as they're read."""
+
+    def __init__(self, n, seed=1):
+        emulator = MC6470Emulator(rate=None, seed=seed, batch_size=2048)
+        emulator.write(b"ac")
+        self.chunk = emulator.output()
+        self.ptys = []
+        for _ in range(n):
+            master, slave = os.openpty()
+            tty.setraw(slave)
+            os.set_blocking(master, False)
+            self.ptys.append((master, slave, os.ttyname(slave)))
+        context = multiprocessing.get_context("fork")
+        self._stop = context.Event()
+        self._process = context.Process(target=self._run, daemon=True)
+
+    @property
+    def ports(self):
+        return [name for _, _, name in self.ptys]
+
+    def _run(self):
+        masters = [m for m, _, _ in self.ptys]
+        pos = {m: 0 for m in masters}
+        size = len(self.chunk)
+        looped = memoryview(self.chunk * 2)  # so any position has a whole chunk after it
+        while not self._stop.is_set():
+            readable, writable, _ = select.select(masters, masters, [], 0.05)
+            for m in readable:
+                os.read(m, 4096)  # commands from the host, which don't matter here
+            for m in writable:
+                try:
+                    pos[m] = (pos[m] + os.write(m, looped[pos[m] : pos[m] + size])) % size
+                except BlockingIOError:
+                    pass
+
+    def start(self):
+        self._process.start()
+
+    def close(self):
+        self._stop.set()
+        self._process.join()
+        for master, slave, _ in self.ptys:
+            os.close(master)
+            os.close(slave)
+
+
+def _imus(ports):
+    return [MC6470IMU(port) for port in ports]
+
+
+def _samples(stores):
+    return sum(len(s.mag_points) + len(s.acc_points) for s in stores)
+
+
+def run_selector(imus, duration):
+    reader = MultiIMUReader()
+    stores = [reader.add(f"imu{i}", imu) for i, imu in enumerate(imus)]
+    reader.start()
+    time.sleep(0.2)  # warm up
+    n0, c0, t0 = _samples(stores), time.process_time(), time.perf_counter()
+    time.sleep(duration)
+    n1, c1, t1 = _samples(stores), time.process_time(), time.perf_counter()
+    threads = threading.active_count()
+    reader.close()
+    return (n1 - n0) / (t1 - t0), (c1 - c0) / (t1 - t0), threads
+
+
+def run_threads(imus, duration):
+    stores = [IMUPointStore(imu) for imu in imus]
+    for s in stores:
+        s.start_gathering()
+        s.start()
+    time.sleep(0.2)
+    n0, c0, t0 = _samples(stores), time.process_time(), time.perf_counter()
+    time.sleep(duration)
+    n1, c1, t1 = _samples(stores), time.process_time(), time.perf_counter()
+    threads = threading.active_count()
+    for s in stores:
+        s.stop()
+    for s in stores:
+        s.join()
+    return (n1 - n0) / (t1 - t0), (c1 - c0) / (t1 - t0), threads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", default="1,8,32,64", help="comma separated device counts")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds to measure each run for")
+    parser.add_argument("--modes", default="selector,threads", help="selector, threads or both")
+    args = parser.parse_args(argv)
+
+    modes = {"selector": run_selector, "threads": run_threads}
+    print(f"{'devices':>7} {'mode':>9} {'samples/s':>12} {'per device':>11} {'cpu':>6} {'threads':>7}")
+    for n in [int(d) for d in args.devices.split(",")]:
+        for mode in args.modes.split(","):
+            feeder = PtyFeeder(n)
+            feeder.start()
+            imus = _imus(feeder.ports)
+            try:
+                rate, cpu, threads = modes[mode](imus, args.duration)
+            finally:
+                for imu in imus:
+                    imu.disconnect()
+                feeder.close()
+            print(f"{n:7} {mode:>9} {rate:12.0f} {rate / n:11.0f} {cpu * 100:5.0f}% {threads:7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""Benchmarks for parsing, storing, fitting and error evaluation, on synthetic distorted ellipsoid clouds.
+
+Every cloud comes from the same seed, so runs are comparable. Each benchmark is timed at every size (best of a few
+runs), and its peak traced memory is measured in a separate run. Results can be saved as a baseline and later runs
+compared against it, which exits with 1 if anything got slower or bigger than the tolerance allows:
+
+    python benchmarks/suite.py --save benchmarks/baseline.json
+    python benchmarks/suite.py --compare benchmarks/baseline.json
+    python benchmarks/suite.py --sizes 1e3,1e5,1e7 --only get_err,ls_ellipsoid
+
+Baselines are machine specific, so make one on the machine you compare on.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calimu.pcl_algo.center  # noqa: E402
+import calimu.pcl_algo.err  # noqa: E402
+import calimu.pcl_algo.fit  # noqa: E402
+import calimu.pcl_algo.robust  # noqa: E402
+from calimu.imu.devices.mc6470 import MC6470IMU  # noqa: E402
+from calimu.imu.protocol import encode_frames  # noqa: E402
+from calimu.imu.store import IMUPointStore  # noqa: E402
+from calimu.pcl_algo.stats import CloudStats  # noqa: E402
+from calimu.pcl_algo.util import ls_ellipsoid  # noqa: E402
+
+SEED = 1234
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+
+
+def synthetic_cloud(n, seed=SEED, radius=500.0, noise=3.0):
+    """n int32 points on a sphere, soft iron distorted by a random symmetric matrix and hard iron offset."""
+    rng = np.random.default_rng(seed)
+    u = rng.normal(size=(n, 3))
+    u /= np.linalg.norm(u, axis=1)[:, np.newaxis]
+    soft = np.eye(3) + rng.uniform(-0.2, 0.2, (3, 3))
+    soft = (soft + soft.T) / 2
+    hard = rng.uniform(-200, 200, 3)
+    cloud = (u * radius) @ soft.T + hard + rng.normal(scale=noise, size=(n, 3))
+    return cloud.astype(np.int32)
+
+
+def _text_stream(cloud):
+    tags = np.where(np.arange(cloud.shape[0]) % 2 == 0, "mag", "acc")
+    return "".join(
+        f"Got {t} data: [{x}], [{y}], [{z}]\r\n" for t, (x, y, z) in zip(tags.tolist(), cloud.tolist())
+    ).encode()
+
+
+def _binary_stream(cloud):
+    tags = list(("ma" * (cloud.shape[0] // 2 + 1))[: cloud.shape[0]])
+    return encode_frames(tags, cloud.astype(np.int16))
+
+
+class MemorySerial(object):
+    """Just enough of a pyserial port to feed bytes from memory to a reader, up to chunk bytes per read, like a 4k
+    serial driver buffer that's always full."""
+
+    def __init__(self, data, chunk=4096):
+        self.data = memoryview(data)
+        self.pos = 0
+        self.chunk = chunk
+        self.is_open = True
+        self.timeout = 0
+
+    @property
+    def finished(self):
+        return self.pos >= len(self.data)
+
+    @property
+    def in_waiting(self):
+        return min(self.chunk, len(self.data) - self.pos)
+
+    def read(self, size=1):
+        out = bytes(self.data[self.pos : self.pos + size])
+        self.pos += len(out)
+        return out
+
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        self.is_open = False
+
+
+def _imu(data, binary=False):
+    imu = MC6470IMU(binary=binary)
+    imu.connection = MemorySerial(data)
+    return imu
+
+
+def _parse_iter(data, n):
+    imu = _imu(data)
+    count = 0
+    for _ in imu.mag_accel_iter():
+        count += 1
+        if count >= n:
+            break
+
+
+def _parse_batches(data, n, binary=False):
+    imu = _imu(data, binary)
+    count = 0
+    for batch in imu.mag_accel_batch_iter():
+        count += batch["m"].shape[0] + batch["a"].shape[0]
+        if count >= n or imu.connection.finished:
+            break
+
+
+def _store_append(data, n, backing_dir=None):
+    imu = _imu(data)
+    if backing_dir is not None:
+        backing_dir = tempfile.mkdtemp(dir=backing_dir)  # a fresh one, or the store would load the last run's points
+    store = IMUPointStore(imu, backing_dir=backing_dir)
+    store.start_gathering()  # before the thread starts, so it never reads in the debug loop
+    store.start()
+    while len(store.mag_points) + len(store.acc_points) < n and not imu.connection.finished:
+        time.sleep(0.001)
+    store.stop()
+    store.join()
+    if backing_dir is not None:
+        shutil.rmtree(backing_dir)
+
+
+def _benchmarks(tmp_dir):
+    # name: (setup(cloud) -> (fn, args), largest size it runs at)
+    def cloud_only(fn):
+        return lambda c: (fn, (c,))
+
+    def with_center(fn):
+        return lambda c: (fn, (c, calimu.pcl_algo.center.by_average(c)))
+
+    def with_ellipsoid(c):
+        poly = ls_ellipsoid(c).ravel()
+        return calimu.pcl_algo.fit.from_ellipsoid, (calimu.pcl_algo.center.by_ellipsoid_fit(poly), poly)
+
+    def get_err(dtype):
+        def setup(c):
+            poly = ls_ellipsoid(c).ravel()
+            xform, _ = calimu.pcl_algo.fit.from_ellipsoid(calimu.pcl_algo.center.by_ellipsoid_fit(poly), poly)
+            return (lambda cloud, x: calimu.pcl_algo.err.get_err(cloud, x, dtype=dtype)), (c, xform)
+
+        return setup
+
+    def stream(make, fn, **kwargs):
+        return lambda c: ((lambda data, n: fn(data, n, **kwargs)), (make(c), c.shape[0]))
+
+    def stats_update(c):
+        return (lambda cloud: CloudStats().update(cloud)), (c,)
+
+    return {
+        "ls_ellipsoid": (cloud_only(ls_ellipsoid), None),
+        "center.by_bounds": (cloud_only(calimu.pcl_algo.center.by_bounds), None),
+        "center.by_average": (cloud_only(calimu.pcl_algo.center.by_average), None),
+        "center.by_sphere_fit": (cloud_only(calimu.pcl_algo.center.by_sphere_fit), None),
+        "center.by_ellipsoid_fit": (
+            cloud_only(lambda c: calimu.pcl_algo.center.by_ellipsoid_fit(ls_ellipsoid(c))),
+            None,
+        ),
+        "stats.update": (stats_update, None),
+        "fit.from_axis_aligned_bounding_box": (with_center(calimu.pcl_algo.fit.from_axis_aligned_bounding_box), None),
+        "fit.from_sphere": (with_center(calimu.pcl_algo.fit.from_sphere), None),
+        "fit.from_pca": (with_center(calimu.pcl_algo.fit.from_pca), None),
+        "fit.from_ellipsoid": (with_ellipsoid, None),
+        "robust.ransac_ellipsoid": (cloud_only(calimu.pcl_algo.robust.ransac_ellipsoid), 100_000),
+        "robust.irls_ellipsoid": (cloud_only(calimu.pcl_algo.robust.irls_ellipsoid), 1_000_000),
+        "get_err": (get_err(np.float64), None),
+        "get_err[float32]": (get_err(np.float32), None),
+        "parse.mag_accel_iter": (stream(_text_stream, _parse_iter), 1_000_000),
+        "parse.mag_accel_batch_iter": (stream(_text_stream, _parse_batches), 1_000_000),
+        "parse.mag_accel_batch_iter[binary]": (stream(_binary_stream, _parse_batches, binary=True), 1_000_000),
+        "store.append": (stream(_text_stream, _store_append), 1_000_000),
+        "store.append[mapped]": (stream(_text_stream, _store_append, backing_dir=tmp_dir), 1_000_000),
+    }
+
+
+def _measure(fn, args, min_time=0.2, max_repeats=1000):
+    # peak memory from one traced run, then the best of untraced runs for time
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = float("inf")
+    total = 0.0
+    for _ in range(max_repeats):
+        t0 = time.perf_counter()
+        fn(*args)
+        dt = time.perf_counter() - t0
+        best = min(best, dt)
+        total += dt
+        if total >= min_time:
+            break
+    return best, peak
+
+
+def run(sizes, only=None, out=sys.stdout):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        benchmarks = _benchmarks(tmp_dir)
+        names = [n for n in benchmarks if only is None or n in only]
+        for n in sizes:
+            cloud = synthetic_cloud(n)
+            for name in names:
+                setup, max_n = benchmarks[name]
+                if max_n is not None and n > max_n:
+                    continue
+                fn, args = setup(cloud)
+                seconds, peak = _measure(fn, args)
+                key = f"{name}@{n}"
+                results[key] = {"seconds": seconds, "points_per_second": n / seconds, "peak_bytes": peak}
+                print(
+                    f"{key:45} {seconds * 1000:10.2f} ms {n / seconds / 1e6:9.2f} Mpts/s {peak / 1e6:9.2f} MB",
+                    file=out,
+                )
+                out.flush()
+    return results
+
+
+def compare(results, baseline, tolerance, out=sys.stdout):
+    """Print how results compare to a baseline, and return the keys that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':45} {'time':>8} {'memory':>8}", file=out)
+    for key, r in results.items():
+        b = baseline.get(key)
+        if b is None:
+            continue
+        dt = r["seconds"] / b["seconds"] - 1
+        dm = (r["peak_bytes"] + 1) / (b["peak_bytes"] + 1) - 1
+        # tiny peaks are mostly noise, so memory only counts once it's over a megabyte
+        slow = dt > tolerance
+        big = dm > tolerance and r["peak_bytes"] - b["peak_bytes"] > 1 << 20
+        flag = "  <- REGRESSION" if slow or big else ""
+        print(f"{key:45} {dt * 100:+7.1f}% {dm * 100:+7.1f}%{flag}", file=out)
+        if flag:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(s) for s in DEFAULT_SIZES),
+        help="comma separated cloud sizes, like 1e3,1e5,1e7",
+    )
+    parser.add_argument("--only", help="comma separated benchmark names to run")
+    parser.add_argument("--save", metavar="FILE", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown/growth, 0.25 is 25%%")
+    args = parser.parse_args(argv)
+
+    sizes = [int(float(s)) for s in args.sizes.split(",")]
+    only = set(args.only.split(",")) if args.only else None
+    results = run(sizes, only)
+
+    if args.save:
+        meta = {
+            "seed": SEED,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        }
+        with open(args.save, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
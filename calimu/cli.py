@@ -0,0 +1,135 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""calimu-fit: gather or load a point cloud, fit it, and optionally upload the offsets, all without a display."""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from calimu.imu.com_imu import scan_ports
+from calimu.pcl_algo.pipeline import CENTER_METHODS, FIT_METHODS
+from calimu.session import CalibrationSession
+
+_SENSORS = {"mag": "m", "accel": "a"}
+
+
+def _parser():
+    p = argparse.ArgumentParser(
+        prog="calimu-fit",
+        description="Fit an ellipsoid to IMU data and print or upload the calibration. "
+        "Points come from --load, or are gathered from --port if nothing is loaded.",
+    )
+    p.add_argument(
+        "--port", help="serial port of the IMU, for gathering or --upload. replay://FILE?speed=N replays a --record"
+    )
+    p.add_argument("--baud", type=int, default=None, help="baud rate of the port")
+    p.add_argument("--binary", action="store_true", help="ask the IMU for binary frames instead of text")
+    p.add_argument("--load", metavar="FILE", help="fit a recorded cloud: .npy, or csv/txt with x,y,z rows")
+    p.add_argument("--sensor", choices=sorted(_SENSORS), default="mag", help="which sensor's points to fit")
+    p.add_argument("--duration", type=float, default=None, help="seconds to gather for")
+    p.add_argument("--samples", type=int, default=None, help="points to gather")
+    p.add_argument("--min-distance", type=float, default=None, help="drop points closer than this to earlier ones")
+    p.add_argument("--record", metavar="FILE", help="record every byte read from --port, for replaying later")
+    p.add_argument("--save-cloud", metavar="FILE", help="save the points that were fit (.npy or csv/txt)")
+    p.add_argument("--center", choices=list(CENTER_METHODS), default="ellipsoid")
+    p.add_argument("--fit", choices=list(FIT_METHODS), default="ellipsoid")
+    p.add_argument("--all", action="store_true", help="try every center and fit combination and keep the best")
+    p.add_argument("--top", type=int, default=5, help="how many of the --all results to print")
+    p.add_argument("--output", metavar="FILE", help="write the chosen fit and its errors as json")
+    p.add_argument("--upload", action="store_true", help="send the chosen fit's offsets to the IMU on --port")
+    p.add_argument("--scan", action="store_true", help="probe every serial port, list which ones are IMUs, and exit")
+    p.add_argument(
+        "--scan-timeout", type=float, help="seconds to give each port to answer --scan, long enough to boot by default"
+    )
+    return p
+
+
+def _fit_dict(sensor, result, rel_std, mae):
+    return {
+        "sensor": sensor,
+        "center_method": result.center_method,
+        "fit_method": result.fit_method,
+        "center": [float(c) for c in result.center],
+        "xform": np.asarray(result.xform, dtype=np.float64).tolist(),
+        "avg_scale": float(result.avg_scale),
+        "rel_std": float(rel_std),
+        "mae": float(mae),
+    }
+
+
+def _print_fit(d, out):
+    print(f"{d['center_method']} center, {d['fit_method']} fit:", file=out)
+    print(f"  RSD: {d['rel_std'] * 100.0}%", file=out)
+    print(f"  MAE: {d['mae'] * 100.0}%", file=out)
+    print(f"  center: {d['center']}", file=out)
+    print("  xform:", file=out)
+    for row in d["xform"]:
+        print("    [" + ",\t".join(f"{v:.6f}" for v in row) + "]", file=out)
+
+
+def main(argv=None, out=sys.stdout):
+    args = _parser().parse_args(argv)
+    if args.scan:
+        found = scan_ports(baud=args.baud, timeout=args.scan_timeout)
+        for r in found:
+            status = "IMU" if r.is_imu else f"error: {r.error}" if r.error is not None else "no answer"
+            print(f"{r.port}: {r.description} ({status}, {r.seconds * 1000:.0f} ms)", file=out)
+        if not found:
+            print("no serial ports found", file=out)
+        return 0 if any(r.is_imu for r in found) else 1
+
+    sensor = _SENSORS[args.sensor]
+    if args.load is None and args.port is None:
+        _parser().error("give --load or --port")
+    if args.upload and args.port is None:
+        _parser().error("--upload needs --port")
+
+    if args.port is not None:
+        session = CalibrationSession.connect(args.port, args.baud, args.binary, args.min_distance)
+        if args.record is not None:
+            session.imu.start_recording(args.record)
+    else:
+        session = CalibrationSession(min_distance=args.min_distance)
+
+    try:
+        if args.load is not None:
+            session.load(args.load, sensor)
+        else:
+            duration = args.duration
+            if duration is None and args.samples is None:
+                duration = 30.0
+            counts = session.gather(duration, args.samples, sensors=(sensor,))
+            print(f"gathered {counts[sensor]} points", file=out)
+        if args.save_cloud is not None:
+            session.save(args.save_cloud, sensor)
+
+        if args.all:
+            results = session.fit_all(sensor)
+            if not results:
+                print("no combination could fit these points", file=out)
+                return 1
+            fits = [_fit_dict(args.sensor, r, r.rel_std, r.mae) for r in results]
+            for d in fits[: args.top]:
+                _print_fit(d, out)
+        else:
+            result = session.fit(sensor, args.center, args.fit)
+            fits = [_fit_dict(args.sensor, result, *session.error(sensor, result))]
+            _print_fit(fits[0], out)
+
+        best = fits[0]
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                json.dump(best, f, indent=2)
+        if args.upload:
+            chosen = results[0] if args.all else result
+            session.upload(sensor, chosen)
+            print(f"uploaded {best['center_method']} center, {best['fit_method']} fit offsets", file=out)
+    finally:
+        session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,12 @@
 # Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
 
+import os
 import time
 import tkinter as tk
 import tkinter.font as tk_font
 from tkinter import ttk
 
-import vtk
+import numpy as np
 
 import calimu.pcl_algo.center
 import calimu.pcl_algo.err
@@ -15,9 +16,11 @@ import calimu.pcl_algo.util
 from calimu.imu.com_imu import list_ports
 from calimu.imu.devices.mc6470 import MC6470IMU
 from calimu.imu.store import IMUPointStore
-from calimu.imu.visualization import IMUPointDisplayer
-from svtk.tk_integration import vtk_tk_anchor_left, vtk_tk_match_height
-from svtk.util import array_to_vtk_transform, hue_from_index
+from calimu.jobs import JobRunner
+from calimu.pcl_algo.pipeline import CENTER_METHODS, FIT_METHODS, run_fit
+from calimu.pcl_algo.sweep import sweep
+
+# vtk and svtk take seconds to import, so they're imported where they're used, once the Tk window is already up
 
 
 def begin_region_with_sep_and_label(container, text, underlined=False):
@@ -127,73 +130,28 @@ class IMUApp(tk.Tk):
 
     def __get_fit_pts_and_type(self):
         if self.radio_option_data.get() == 0:
-            data = self.store.mag_points
+            sensor = "m"
             desc1 = "Mag"
         elif self.radio_option_data.get() == 1:
-            data = self.store.acc_points
+            sensor = "a"
             desc1 = "Accel"
         else:
             raise NotImplementedError(
                 "only magnetometer and accelerometer data is supported."
             )
+        data, stats, version = self.store.snapshot(sensor)
 
-        return data, desc1
-
-    def __get_fit_center(self, data):
-        if self.radio_option_center.get() == 0:
-            center = calimu.pcl_algo.center.by_zero(None)
-            desc2 = "Zero"
-        elif self.radio_option_center.get() == 1:
-            center = calimu.pcl_algo.center.by_bounds(data)
-            desc2 = "Bounds"
-        elif self.radio_option_center.get() == 2:
-            center = calimu.pcl_algo.center.by_average(data)
-            desc2 = "Avg"
-        elif self.radio_option_center.get() == 3:
-            center = calimu.pcl_algo.center.by_sphere_fit(data)
-            desc2 = "Sphere"
-        elif self.radio_option_center.get() == 4:
-            self.ellipsoid_poly = calimu.pcl_algo.util.ls_ellipsoid(data)
-            center = calimu.pcl_algo.center.by_ellipsoid_fit(self.ellipsoid_poly)
-            desc2 = "Ellipsoid"
-        else:
-            raise NotImplementedError("Unknown center method")
-
-        return center, desc2
-
-    def __get_fit(self, data, center):
-        if self.radio_option_fit.get() == 0:
-            (
-                xform,
-                avg_scale,
-            ) = calimu.pcl_algo.fit.from_axis_aligned_bounding_box(data, center)
-            desc3 = "AABB"
-        elif self.radio_option_fit.get() == 1:
-            xform, avg_scale = calimu.pcl_algo.fit.from_pca(data, center)
-            desc3 = "PCA"
-        elif self.radio_option_fit.get() == 2:
-            xform, avg_scale = calimu.pcl_algo.fit.from_sphere(data, center)
-            desc3 = "Sphere"
-        elif self.radio_option_fit.get() == 3:
-            if self.ellipsoid_poly is None:
-                self.ellipsoid_poly = calimu.pcl_algo.util.ls_ellipsoid(data)
-            xform, avg_scale = calimu.pcl_algo.fit.from_ellipsoid(
-                center, self.ellipsoid_poly
-            )
-            self.ellipsoid_poly = None
-            desc3 = "Ellipsoid"
-        else:
-            raise NotImplementedError("Unknown fit method")
-
-        return xform, avg_scale, desc3
-
-    def add_fit_command(self):
-
-        data, desc1 = self.__get_fit_pts_and_type()
+        return data, stats, (sensor, version), desc1
 
-        center, desc2 = self.__get_fit_center(data)
+    def __get_fit_methods(self):
+        # the radio values are indices into the pipeline's method lists
+        center_method = list(CENTER_METHODS)[self.radio_option_center.get()]
+        fit_method = list(FIT_METHODS)[self.radio_option_fit.get()]
+        return center_method, fit_method
 
-        xform, avg_scale, desc3 = self.__get_fit(data, center)
+    def __make_fit_actor(self, xform, color):
+        import vtk
+        from svtk.util import array_to_vtk_transform
 
         t = array_to_vtk_transform(xform)
 
@@ -216,24 +174,119 @@ class IMUApp(tk.Tk):
         mapper = vtk.vtkPolyDataMapper()
         mapper.SetInputConnection(tf_a.GetOutputPort())
 
-        c = hue_from_index(self.fit_objects_color_index)
-        self.fit_objects_color_index += 1
-
         # Set up an actor for the node
         # noinspection PyUnresolvedReferences
         sphere_actor = vtk.vtkActor()
         sphere_actor.GetProperty().SetRepresentationToWireframe()
-        sphere_actor.GetProperty().SetColor(*c)
+        sphere_actor.GetProperty().SetColor(*color)
         sphere_actor.SetMapper(mapper)
 
+        return sphere, tf_a, mapper, sphere_actor
+
+    def add_fit_command(self):
+        data, stats, data_key, desc1 = self.__get_fit_pts_and_type()
+        center_method, fit_method = self.__get_fit_methods()
+        try:
+            processes = self.fit_processes_var.get()
+        except tk.TclError:
+            return  # spinbox is mid-edit
+
+        key = data_key + (center_method, fit_method)
+        result = self.store.fit_cache.get_fit(key)
+        if result is not None:
+            self.__add_fit_result(result, key, desc1)
+            return
+
+        # the fit runs on a worker, against the snapshot, and gets added to the list once it's done
+        self.jobs.submit(
+            run_fit,
+            data,
+            center_method,
+            fit_method,
+            stats,
+            processes=processes if processes > 1 else None,
+            on_done=lambda r: self.__add_fit_result(r, key, desc1),
+        )
+
+    def fit_all_command(self):
+        data, stats, data_key, desc1 = self.__get_fit_pts_and_type()
+        try:
+            top_k = self.sweep_top_k_var.get()
+            processes = self.fit_processes_var.get()
+        except tk.TclError:
+            return  # spinbox is mid-edit
+
+        self.jobs.submit(
+            sweep,
+            data,
+            stats,
+            processes=processes,
+            on_done=lambda results: self.__add_fit_results(results, data_key, desc1, top_k),
+        )
+
+    def __add_fit_results(self, results, data_key, desc1, top_k):
+        # the sweep already got the errors of every combination, so cache all of them, not just the ones shown
+        for result in results:
+            key = data_key + (result.center_method, result.fit_method)
+            self.store.fit_cache.put_err(key, (result.rel_std, result.mae))
+            self.store.fit_cache.put_fit(key, result)
+        for result in results[:top_k]:
+            key = data_key + (result.center_method, result.fit_method)
+            self.__add_fit_result(result, key, desc1)
+
+    def __add_fit_result(self, result, key, desc1):
+        self.store.fit_cache.put_fit(key, result)
+
+        desc2 = CENTER_METHODS[result.center_method]
+        desc3 = FIT_METHODS[result.fit_method]
+        xform, avg_scale = result.xform, result.avg_scale
+
+        from svtk.util import hue_from_index
+
+        c = hue_from_index(self.fit_objects_color_index)
+        self.fit_objects_color_index += 1
+
+        sphere, tf_a, mapper, sphere_actor = self.__make_fit_actor(xform, c)
+
         pos = self.fit_list_box.size()
         self.fit_list_box.insert(pos, ",\t".join([desc1, desc2, desc3]))
         hidden = False
         self.fit_objects.append(
-            [sphere, tf_a, mapper, sphere_actor, hidden, avg_scale, xform, desc1]
+            [sphere, tf_a, mapper, sphere_actor, hidden, key, avg_scale, xform, desc1]
         )  # todo: make this a class
         self.display.displayer.renderer.AddActor(sphere_actor)
 
+    def update_live_fit(self):
+        sensor = "m" if self.radio_option_data.get() == 0 else "a"
+        # a copy made under the store's lock, since the gather thread updates the sums while this solves them
+        _, stats, _ = self.store.snapshot(sensor)
+        live_fit = stats.ellipsoid
+        show = self.live_fit_var.get() and self.store.is_gathering() and live_fit.count >= 9
+
+        if not show:
+            if self.live_fit_object is not None:
+                self.display.displayer.renderer.RemoveActor(self.live_fit_object[3])
+                self.live_fit_object = None
+            return
+
+        try:
+            poly = live_fit.solve()
+            center = calimu.pcl_algo.center.by_ellipsoid_fit(poly)
+            xform, _ = calimu.pcl_algo.fit.from_ellipsoid(center, poly)
+        except np.linalg.LinAlgError:
+            return  # not enough spread in the points yet
+
+        if self.live_fit_object is None:
+            self.live_fit_object = self.__make_fit_actor(xform, (1, 1, 1))
+            self.display.displayer.renderer.AddActor(self.live_fit_object[3])
+        else:
+            from svtk.util import array_to_vtk_transform
+
+            tf_a = self.live_fit_object[1]
+            tf_a.SetTransform(array_to_vtk_transform(xform))
+            tf_a.Update()
+        set_copyable_text_label(self.lbl_live_residual, f"{live_fit.residual(poly):.5f}")
+
     def rem_fit_command(self):
         i = self.fit_list_box.curselection()
         if i is not None:
@@ -242,9 +295,11 @@ class IMUApp(tk.Tk):
             return
         # listbox.get(i)
         # text = (listBox1.SelectedItem as DataRowView)["columnName"].ToString();
+        self.jobs.cancel("err")
         self.display.displayer.renderer.RemoveActor(self.fit_objects[i][3])
         del self.fit_objects[i]
         self.fit_list_box.delete(i)
+        self.update_residual_colors()
 
     def hide_fit_command(self):
         i = self.fit_list_box.curselection()
@@ -287,16 +342,6 @@ class IMUApp(tk.Tk):
         else:
             raise ValueError
 
-    def __get_fit_box_pts(self, offset_type):
-        if offset_type == "Mag":
-            pts = self.store.mag_points
-        elif offset_type == "Accel":
-            pts = self.store.acc_points
-        else:
-            raise RuntimeError("Unknown point type")
-
-        return pts
-
     def fit_list_box_selected(self, _):
         # print(i)
         i = self.fit_list_box.curselection()
@@ -305,32 +350,27 @@ class IMUApp(tk.Tk):
             i = i[0]
             xform = self.fit_objects[i][-2]
 
-            offset_type = self.fit_objects[i][-1]
-
-            pts = self.__get_fit_box_pts(offset_type)
-
-            rel, ste = calimu.pcl_algo.err.get_err(pts, xform)
+            key = self.fit_objects[i][5]
+            sensor, fit_version = key[:2]
 
-            set_copyable_text_label(self.lbl_rel_std, f"{rel * 100.0}%")
-            set_copyable_text_label(self.lbl_std_err, f"{ste * 100.0}%")
+            pts, _, version = self.store.snapshot(sensor)
 
-            if rel < 0.005:
-                self.lbl_rel_std["bg"] = TKColors.pale_green
-            elif rel < 0.05:
-                self.lbl_rel_std["bg"] = TKColors.green_yellow
-            elif rel < 0.5:
-                self.lbl_rel_std["bg"] = TKColors.light_goldenrod
+            # the error is only cached while the points are still the ones the fit was made from
+            err = self.store.fit_cache.get_err(key) if version == fit_version else None
+            if err is not None:
+                self.jobs.cancel("err")
+                self.__show_fit_err(err)
             else:
-                self.lbl_rel_std["bg"] = TKColors.pink
-
-            if abs(ste) < 0.01:
-                self.lbl_std_err["bg"] = TKColors.pale_green
-            elif abs(ste) < 0.1:
-                self.lbl_std_err["bg"] = TKColors.green_yellow
-            elif abs(ste) < 1:
-                self.lbl_std_err["bg"] = TKColors.light_goldenrod
-            else:
-                self.lbl_std_err["bg"] = TKColors.pink
+                # a click on another fit makes this one stale, so only the last click's error shows up
+                set_copyable_text_label(self.lbl_rel_std, "(Working...)")
+                set_copyable_text_label(self.lbl_std_err, "(Working...)")
+                self.jobs.submit(
+                    calimu.pcl_algo.err.get_err,
+                    pts,
+                    xform,
+                    key="err",
+                    on_done=lambda e: self.__cache_and_show_fit_err(e, key, version),
+                )
 
             set_copyable_text_label(
                 self.lbl_ellipsoid_center,
@@ -346,48 +386,119 @@ class IMUApp(tk.Tk):
             set_copyable_text_label(self.lbl_ellipsoid_matrix, mat_str)
 
         else:
+            self.jobs.cancel("err")
             self.btn_apply_ellipsoid["state"] = "disabled"
+        self.update_residual_colors()
+
+    def update_residual_colors(self):
+        # while checked, the selected fit's sensor gets its points colored by their residuals against that fit
+        i = self.fit_list_box.curselection()
+        fit = self.fit_objects[i[0]] if self.residual_colors_var.get() and i else None
+        key = None if fit is None else fit[5]
+        if key == self.residual_colors_key:
+            return
+        if self.residual_colors_key is not None:
+            self.display.color_by_residual(self.residual_colors_key[0], None)
+        self.residual_colors_key = key
+        if fit is not None:
+            self.display.color_by_residual(key[0], fit[-2])
+
+    def __cache_and_show_fit_err(self, err, key, version):
+        if version == key[1]:
+            self.store.fit_cache.put_err(key, err)
+        self.__show_fit_err(err)
+
+    def __show_fit_err(self, err):
+        rel, ste = err
+        set_copyable_text_label(self.lbl_rel_std, f"{rel * 100.0}%")
+        set_copyable_text_label(self.lbl_std_err, f"{ste * 100.0}%")
+
+        if rel < 0.005:
+            self.lbl_rel_std["bg"] = TKColors.pale_green
+        elif rel < 0.05:
+            self.lbl_rel_std["bg"] = TKColors.green_yellow
+        elif rel < 0.5:
+            self.lbl_rel_std["bg"] = TKColors.light_goldenrod
+        else:
+            self.lbl_rel_std["bg"] = TKColors.pink
+
+        if abs(ste) < 0.01:
+            self.lbl_std_err["bg"] = TKColors.pale_green
+        elif abs(ste) < 0.1:
+            self.lbl_std_err["bg"] = TKColors.green_yellow
+        elif abs(ste) < 1:
+            self.lbl_std_err["bg"] = TKColors.light_goldenrod
+        else:
+            self.lbl_std_err["bg"] = TKColors.pink
+
+    def update_busy_indicator(self):
+        busy = self.jobs.busy()
+        if busy != self.showing_busy:
+            if busy:
+                self.progress_busy.start(20)
+            else:
+                self.progress_busy.stop()
+            self.showing_busy = busy
+
+    def set_min_distance_command(self):
+        text = self.min_distance_var.get().strip()
+        try:
+            min_distance = float(text) if text else None
+            if min_distance is not None and min_distance <= 0:
+                min_distance = None
+        except ValueError:
+            return
+        self.store.set_min_distance(min_distance)
+
+    def set_lod_command(self):
+        text = self.lod_voxel_var.get().strip()
+        try:
+            stride = self.lod_stride_var.get()
+            voxel_size = float(text) if text else None
+            if voxel_size is not None and voxel_size <= 0:
+                voxel_size = None
+        except (ValueError, tk.TclError):
+            return
+        self.display.set_lod(stride, voxel_size)
+
+    def update_octree_display(self):
+        sensor = "m" if self.radio_option_data.get() == 0 else "a"
+        grid = self.store.voxels[sensor]
+        try:
+            depth = self.octree_depth_var.get()
+        except tk.TclError:
+            return  # spinbox is mid-edit
+        key = None
+        if self.show_octree_var.get() and grid is not None and len(grid):
+            key = (sensor, depth, len(grid), grid.min_distance)
+        if key == self.octree_actor_key:
+            return
+
+        if self.octree_actor is not None:
+            self.display.displayer.renderer.RemoveActor(self.octree_actor)
+            self.octree_actor = None
+        self.octree_actor_key = key
+        if key is None:
+            return
+        from calimu.imu.visualization import make_voxel_actor
+
+        centers, size = grid.cells(depth)
+        color = [c / 255.0 for c in self.store.colors[sensor]]
+        self.octree_actor = make_voxel_actor(centers, size, color)
+        self.display.displayer.renderer.AddActor(self.octree_actor)
 
     def delete_mag_pts_cmd(self):
-        (
-            locations,
-            colors,
-            vertices,
-        ) = self.display.displayer.callback_instance.get_points()
-        indices = []
-        # you could search by location instead of color, or keep index info with the points
-        # (like get something back from vtk that tells the indices and store that),
-        #  but I'm fine with keeping the points one color for now
-        for c in range(colors.shape[0]):
-            # noinspection PyTypeChecker
-            if all(
-                    colors[c] == self.store.colors["m"]
-            ):  # this isn't a bool pycharm... it's an array of them.
-                indices.append(c)
-        self.display.displayer.callback_instance.del_points(indices)
-        del self.store.mag_points
-        self.store.mag_points = []
+        self.display.clear_points("m")
 
     def delete_acc_pts_cmd(self):
-        (
-            locations,
-            colors,
-            vertices,
-        ) = self.display.displayer.callback_instance.get_points()
-        indices = []
-        # you could search by location instead of color, or keep index info with the points
-        # (like get something back from vtk that tells the indices and store that),
-        #  but I'm fine with keeping the points one color for now
-        for c in range(colors.shape[0]):
-            # noinspection PyTypeChecker
-            if all(colors[c] == self.store.colors["a"]):
-                indices.append(c)
-        self.display.displayer.callback_instance.del_points(indices)
-        del self.store.acc_points
-        self.store.acc_points = []
+        self.display.clear_points("a")
 
     def mainloop(self, n: int = 0) -> None:
+        from svtk.tk_integration import vtk_tk_anchor_left, vtk_tk_match_height
+
         t0 = time.time()
+        t_telemetry = time.time()
+        t_live_fit = time.time()
         while True:
             try:
                 self.update_idletasks()
@@ -397,6 +508,15 @@ class IMUApp(tk.Tk):
                     vtk_tk_match_height(self.display.displayer.render_window, self)
                     vtk_tk_anchor_left(self.display.displayer.render_window, self)
                     t0 = time.time()
+                if time.time() - t_telemetry > 1.0 / self.telemetry_fps:
+                    self.lbl_telemetry["text"] = str(self.imu.telemetry)
+                    t_telemetry = time.time()
+                self.jobs.poll()
+                self.update_busy_indicator()
+                if time.time() - t_live_fit > 1.0 / self.live_fit_fps:
+                    self.update_live_fit()
+                    self.update_octree_display()
+                    t_live_fit = time.time()
 
             except KeyboardInterrupt:
                 break  # program exited from commandline with ctrl-c
@@ -405,6 +525,7 @@ class IMUApp(tk.Tk):
 
         self.display.displayer.render_window.Finalize()  # equivalent: renWin.Finalize()
         self.display.displayer.render_window_interactor.TerminateApp()
+        self.jobs.shutdown()
         self.store.stop()
         self.store.join()
 
@@ -413,7 +534,7 @@ class IMUApp(tk.Tk):
 
         self.fit_objects = []
         self.fit_objects_color_index = 0
-        self.ellipsoid_poly = None
+        self.jobs = JobRunner()
 
         self.title("IMU Setup")
 
@@ -422,10 +543,13 @@ class IMUApp(tk.Tk):
         self.iconbitmap(dir_path + os.sep + "imucal.ico")
 
         self.update_fps = 60
+        self.telemetry_fps = 2
+        self.live_fit_fps = 5
 
         self.container_com = None
         self.container_connect = None
         self.container_imu_options = None
+        self.lbl_telemetry = None
         self.container_point_options = None
         self.container_ellipsoid_fit = None
         self.container_ellipsoid_opts = None
@@ -446,18 +570,35 @@ class IMUApp(tk.Tk):
         self.setup_connect_container()
         # endregion
         # region POINT OPTIONS CONTAINER
+        self.lod_stride_var = None
+        self.lod_voxel_var = None
         self.setup_point_options()
         # endregion
         # region IMU OPTIONS CONTAINER
         self.setup_imu_options()
         # endregion
+        # region VOXEL CONTAINER
+        self.min_distance_var = None
+        self.show_octree_var = None
+        self.octree_depth_var = None
+        self.octree_actor = None
+        self.octree_actor_key = None
+        self.setup_voxel_options()
+        # endregion
         # region ELLIPSOID CONTAINER
         self.fit_list_box = None
+        self.sweep_top_k_var = None
+        self.fit_processes_var = None
+        self.progress_busy = None
+        self.showing_busy = False
         self.setup_ellipsoid_fit()
 
         self.radio_option_center = None
         self.radio_option_fit = None
         self.radio_option_data = None
+        self.live_fit_var = None
+        self.live_fit_object = None
+        self.lbl_live_residual = None
         self.setup_ellipsoid_options()
 
         self.lbl_rel_std = None
@@ -465,12 +606,19 @@ class IMUApp(tk.Tk):
         self.lbl_ellipsoid_center = None
         self.lbl_ellipsoid_matrix = None
         self.btn_apply_ellipsoid = None
+        self.residual_colors_var = None
+        self.residual_colors_key = None
         self.no_data = "(No Data)"
         self.setup_ellipsoid_info()
         # endregion
         self.imu = MC6470IMU()
         self.store = IMUPointStore(self.imu)
         self.store.start()
+
+        # show the window before the slow vtk import
+        self.update()
+        from calimu.imu.visualization import IMUPointDisplayer
+
         self.display = IMUPointDisplayer(self.store)
         self.display.displayer.tk_visualize()
 
@@ -492,8 +640,8 @@ class IMUApp(tk.Tk):
         self.container_ellipsoid_opts = tk.Frame(self)
         self.container_ellipsoid_opts.pack(side="top", fill="both")
 
-        proj_rtree_container = tk.Frame(self)
-        proj_rtree_container.pack(side="top", fill="both")
+        self.container_proj_rtree = tk.Frame(self)
+        self.container_proj_rtree.pack(side="top", fill="both")
 
         self.container_view_opts = tk.Frame(self)
         self.container_view_opts.pack(side="top", fill="both")
@@ -540,6 +688,25 @@ class IMUApp(tk.Tk):
         )
         del_acc.pack(side=tk.LEFT)
 
+        # what gets drawn. Gathered points are all kept either way.
+        lod_container = center_packed_frame(self.container_point_options)
+
+        lbl_stride = tk.Label(lod_container, text="Draw Every:")
+        lbl_stride.pack(side=tk.LEFT)
+        self.lod_stride_var = tk.IntVar(self)
+        self.lod_stride_var.set(1)
+        stride_spin = tk.Spinbox(
+            lod_container, from_=1, to=1000, width=4, textvariable=self.lod_stride_var
+        )
+        stride_spin.pack(side=tk.LEFT)
+        lbl_lod_voxel = tk.Label(lod_container, text="One Per Voxel:")
+        lbl_lod_voxel.pack(side=tk.LEFT)
+        self.lod_voxel_var = tk.StringVar(self)
+        lod_voxel_entry = tk.Entry(lod_container, textvariable=self.lod_voxel_var, width=6)
+        lod_voxel_entry.pack(side=tk.LEFT)
+        set_lod = tk.Button(lod_container, text="Set", height=1, command=self.set_lod_command)
+        set_lod.pack(side=tk.LEFT, padx=5, pady=5)
+
     def setup_imu_options(self):
         begin_region_with_sep_and_label(self.container_imu_options, "IMU Options:")
 
@@ -577,6 +744,45 @@ class IMUApp(tk.Tk):
         )
         s_imu.pack(side=tk.LEFT)
 
+        self.lbl_telemetry = tk.Label(self.container_imu_options, text="(No Data)")
+        self.lbl_telemetry.pack(side=tk.TOP)
+
+    def setup_voxel_options(self):
+        begin_region_with_sep_and_label(self.container_proj_rtree, "Point Spacing:")
+
+        spacing_container = center_packed_frame(self.container_proj_rtree)
+
+        lbl_min_dist = tk.Label(spacing_container, text="Min Distance:")
+        lbl_min_dist.pack(side=tk.LEFT)
+        self.min_distance_var = tk.StringVar(self)
+        min_dist_entry = tk.Entry(
+            spacing_container, textvariable=self.min_distance_var, width=8
+        )
+        min_dist_entry.pack(side=tk.LEFT)
+        set_min_dist = tk.Button(
+            spacing_container,
+            text="Set",
+            height=1,
+            command=self.set_min_distance_command,
+        )
+        set_min_dist.pack(side=tk.LEFT, padx=5, pady=5)
+
+        octree_container = center_packed_frame(self.container_proj_rtree)
+
+        self.show_octree_var = tk.BooleanVar()
+        chk_octree = tk.Checkbutton(
+            octree_container, text="Show Voxel Octree", variable=self.show_octree_var
+        )
+        chk_octree.pack(side=tk.LEFT)
+        lbl_depth = tk.Label(octree_container, text="Depth:")
+        lbl_depth.pack(side=tk.LEFT)
+        self.octree_depth_var = tk.IntVar(self)
+        self.octree_depth_var.set(4)
+        depth_spin = tk.Spinbox(
+            octree_container, from_=0, to=21, width=3, textvariable=self.octree_depth_var
+        )
+        depth_spin.pack(side=tk.LEFT)
+
     def setup_ellipsoid_fit(self):
         underlined_label(self.container_ellipsoid_fit, "Ellipsoid Fit:")
 
@@ -618,6 +824,42 @@ class IMUApp(tk.Tk):
             side=tk.TOP, anchor=tk.NW, padx=5, expand=True, fill="both"
         )
 
+        ellipsoid_fit_all_button = tk.Button(
+            fit_option_container, text="Fit All", command=self.fit_all_command
+        )
+        ellipsoid_fit_all_button.pack(
+            side=tk.TOP, anchor=tk.NW, padx=5, expand=True, fill="both"
+        )
+
+        top_k_container = tk.Frame(fit_option_container)
+        top_k_container.pack(side=tk.TOP, anchor=tk.NW, padx=5)
+        lbl_top_k = tk.Label(top_k_container, text="Top:")
+        lbl_top_k.pack(side=tk.LEFT)
+        self.sweep_top_k_var = tk.IntVar(self)
+        self.sweep_top_k_var.set(3)
+        top_k_spin = tk.Spinbox(
+            top_k_container, from_=1, to=42, width=3, textvariable=self.sweep_top_k_var
+        )
+        top_k_spin.pack(side=tk.LEFT)
+
+        # 1 runs single fits in this process. Fit All always uses a pool, of this many processes.
+        processes_container = tk.Frame(fit_option_container)
+        processes_container.pack(side=tk.TOP, anchor=tk.NW, padx=5)
+        lbl_processes = tk.Label(processes_container, text="Procs:")
+        lbl_processes.pack(side=tk.LEFT)
+        self.fit_processes_var = tk.IntVar(self)
+        self.fit_processes_var.set(1)
+        processes_spin = tk.Spinbox(
+            processes_container, from_=1, to=os.cpu_count() or 1, width=3, textvariable=self.fit_processes_var
+        )
+        processes_spin.pack(side=tk.LEFT)
+
+        # runs while fits or errors are being computed in the background
+        self.progress_busy = ttk.Progressbar(
+            fit_option_container, mode="indeterminate", length=60
+        )
+        self.progress_busy.pack(side=tk.TOP, anchor=tk.NW, padx=5, pady=5)
+
     def setup_ellipsoid_options(self):
         underlined_label(self.container_ellipsoid_opts, "Ellipsoid Options:")
 
@@ -666,6 +908,22 @@ class IMUApp(tk.Tk):
         )
         chk5.grid(row=4, column=0, sticky=tk.NW)
 
+        chk10 = tk.Radiobutton(
+            ellipsoid_opts_subgrid,
+            text="Center By RANSAC Ellipsoid",
+            variable=self.radio_option_center,
+            value=5,
+        )
+        chk10.grid(row=5, column=0, sticky=tk.NW)
+
+        chk11 = tk.Radiobutton(
+            ellipsoid_opts_subgrid,
+            text="Center By IRLS Ellipsoid",
+            variable=self.radio_option_center,
+            value=6,
+        )
+        chk11.grid(row=6, column=0, sticky=tk.NW)
+
         self.radio_option_fit = tk.IntVar()
         self.radio_option_fit.set(3)
         chk4 = tk.Radiobutton(
@@ -698,6 +956,22 @@ class IMUApp(tk.Tk):
         )
         chk3.grid(row=2, column=1, sticky=tk.NW)
 
+        chk12 = tk.Radiobutton(
+            ellipsoid_opts_subgrid,
+            text="Fit By RANSAC Ellipsoid",
+            variable=self.radio_option_fit,
+            value=4,
+        )
+        chk12.grid(row=4, column=1, sticky=tk.NW)
+
+        chk13 = tk.Radiobutton(
+            ellipsoid_opts_subgrid,
+            text="Fit By IRLS Ellipsoid",
+            variable=self.radio_option_fit,
+            value=5,
+        )
+        chk13.grid(row=5, column=1, sticky=tk.NW)
+
         self.radio_option_data = tk.IntVar()
         chk6 = tk.Radiobutton(
             ellipsoid_opts_subgrid,
@@ -705,7 +979,7 @@ class IMUApp(tk.Tk):
             variable=self.radio_option_data,
             value=0,
         )
-        chk6.grid(row=5, column=0, sticky=tk.NW)
+        chk6.grid(row=7, column=0, sticky=tk.NW)
 
         chk7 = tk.Radiobutton(
             ellipsoid_opts_subgrid,
@@ -713,7 +987,24 @@ class IMUApp(tk.Tk):
             variable=self.radio_option_data,
             value=1,
         )
-        chk7.grid(row=6, column=0, sticky=tk.NW)
+        chk7.grid(row=8, column=0, sticky=tk.NW)
+
+        self.live_fit_var = tk.BooleanVar()
+        chk9 = tk.Checkbutton(
+            ellipsoid_opts_subgrid,
+            text="Live Fit While Gathering",
+            variable=self.live_fit_var,
+        )
+        chk9.grid(row=7, column=1, sticky=tk.NW)
+
+        live_residual_container = tk.Frame(ellipsoid_opts_subgrid)
+        live_residual_container.grid(row=8, column=1, sticky=tk.NW)
+        lbl_residual = tk.Label(live_residual_container, text="Residual:")
+        lbl_residual.pack(side=tk.LEFT)
+        self.lbl_live_residual = selectable_label(
+            live_residual_container, "(No Data)", width=10
+        )
+        self.lbl_live_residual.pack(side=tk.LEFT)
 
     def setup_ellipsoid_info(self):
         underlined_label(self.container_ellipsoid_opts, text="Selected Ellipsoid Info:")
@@ -767,6 +1058,15 @@ class IMUApp(tk.Tk):
         self.lbl_ellipsoid_matrix["font"] = tmp_fnt
         self.lbl_ellipsoid_matrix.pack(side=tk.TOP, pady=5)
 
+        self.residual_colors_var = tk.BooleanVar()
+        chk_residual = tk.Checkbutton(
+            self.container_ellipsoid_opts,
+            text="Color Points By Residual",
+            variable=self.residual_colors_var,
+            command=self.update_residual_colors,
+        )
+        chk_residual.pack(side=tk.TOP)
+
         self.btn_apply_ellipsoid = tk.Button(
             self.container_ellipsoid_opts,
             text="APPLY SELECTED ELLIPSOID OFFSETS",
@@ -0,0 +1,106 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""asyncio versions of the IMU iterators, e.g. `async for batch in (await AsyncIMU.connect(port)).mag_accel_batches()`.
+
+Close the iterators with aclose() when done, so the sensor loops get turned back off.
+"""
+
+import asyncio
+
+from calimu.imu.devices.mc6470 import MC6470IMU
+
+
+class AsyncIMU(object):
+    """Wraps a connected MC6470IMU. Only one of the iterators should run at a time, since they share the port."""
+
+    def __init__(self, imu, poll_interval=0.005):
+        self.imu = imu
+        self.poll_interval = poll_interval
+
+    @classmethod
+    async def connect(cls, port, baud=MC6470IMU.DEFAULT_BAUDRATE, binary=False, **kwargs):
+        """Open a port without blocking the loop while it connects."""
+        loop = asyncio.get_running_loop()
+        imu = await loop.run_in_executor(None, lambda: MC6470IMU(port, baud, binary=binary, **kwargs))
+        return cls(imu)
+
+    @property
+    def telemetry(self):
+        return self.imu.telemetry
+
+    async def disconnect(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.imu.disconnect)
+
+    async def _chunks(self, reader):
+        # yields the reader's output for everything that arrives, reading with timeout=0 so it never blocks
+        connection = self.imu.connection
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        fd = None
+        try:
+            fd = connection.fileno()
+            loop.add_reader(fd, ready.set)
+        except (AttributeError, OSError, ValueError, NotImplementedError):
+            fd = None
+
+        timeout = connection.timeout
+        connection.timeout = 0
+        try:
+            while True:
+                if fd is not None:
+                    await ready.wait()
+                    ready.clear()
+                elif not connection.in_waiting:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                yield reader.read(connection)
+        finally:
+            if fd is not None:
+                loop.remove_reader(fd)
+            if self.imu.connection is connection:
+                connection.timeout = timeout
+
+    async def mag_accel_batches(self):
+        """Async version of MC6470IMU.mag_accel_batch_iter: {"m": (k, 3), "a": (k, 3)} batches as they arrive."""
+        self.imu.start_sample_loops()
+        chunks = self._chunks(self.imu.sample_reader())
+        try:
+            async for batch in chunks:
+                if batch["m"].shape[0] or batch["a"].shape[0]:
+                    yield batch
+        finally:
+            # closing an async generator doesn't close the ones it was iterating, so do it before turning loops off
+            await chunks.aclose()
+            self.imu.stop_sample_loops()
+
+    async def mag_accel_iter(self):
+        """Async version of mag_accel_iter: ("m" or "a", x, y, z) for every sample."""
+        batches = self.mag_accel_batches()
+        try:
+            async for batch in batches:
+                for t, xyz in batch.items():
+                    for x, y, z in xyz.tolist():
+                        yield t, x, y, z
+        finally:
+            await batches.aclose()
+
+    async def orientation_batches(self):
+        """Async version of orientation_batch_iter: (k, 3, 3) arrays of orientations as they arrive."""
+        self.imu.start_orientation_loops()
+        chunks = self._chunks(self.imu.orientation_reader())
+        try:
+            async for orients in chunks:
+                if orients.shape[0]:
+                    yield orients
+        finally:
+            await chunks.aclose()
+            self.imu.stop_orientation_loops()
+
+    async def orientation_iter(self):
+        batches = self.orientation_batches()
+        try:
+            async for orients in batches:
+                for orient in orients:
+                    yield orient
+        finally:
+            await batches.aclose()
@@ -0,0 +1,256 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+
+class PointBuffer(object):
+    """Growable, preallocated numpy buffer of points. Capacity doubles whenever it fills up.
+
+    view() (and np.asarray(buffer)) give zero-copy read-only views of the filled part, so the pcl_algo functions can
+    take a buffer directly. Views stay valid after later appends or a clear(), they just don't see the new data.
+    """
+
+    def __init__(self, dtype=np.int32, width=3, capacity=1024):
+        self.width = width
+        self._shape = (width,) if width else ()
+        self._data = np.empty((capacity,) + self._shape, dtype=dtype)
+        self._size = 0
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    @property
+    def capacity(self):
+        return self._data.shape[0]
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, n):
+        if n <= self.capacity:
+            return
+        capacity = max(self.capacity, 1)
+        while capacity < n:
+            capacity *= 2
+        data = np.empty((capacity,) + self._shape, dtype=self.dtype)
+        data[: self._size] = self._data[: self._size]
+        self._data = data
+
+    def append(self, points):
+        points = np.asarray(points).reshape((-1,) + self._shape)
+        n = points.shape[0]
+        self._reserve(self._size + n)
+        # note: unsafe casting, so int16 buffers wrap instead of raising on out of range values
+        self._data[self._size : self._size + n] = points
+        self._size += n
+
+    def view(self):
+        v = self._data[: self._size].view()
+        v.flags.writeable = False
+        return v
+
+    def clear(self):
+        # new storage rather than resetting _size, so anything still holding a view doesn't see it get overwritten
+        self._data = np.empty((min(self.capacity, 1024),) + self._shape, dtype=self.dtype)
+        self._size = 0
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.view()
+        return self.view().astype(dtype)
+
+    def __getitem__(self, item):
+        return self.view()[item]
+
+
+_MAPPED_MAGIC = b"CALIMUP1"
+# magic, dtype string, width (0 for 1d), point count. Padded to 64 bytes so the data stays aligned.
+_MAPPED_HEADER = struct.Struct("<8s16sIQ")
+_MAPPED_HEADER_SIZE = 64
+
+
+class MappedPointBuffer(object):
+    """PointBuffer backed by an append-only memory-mapped file, so points survive crashes and don't have to fit in RAM.
+
+    Reopening the same path picks up every point appended before, and views work like PointBuffer's.
+    """
+
+    def __init__(self, path, dtype=np.int32, width=3, capacity=1 << 16, flush_interval=1.0):
+        self.path = path
+        self.width = width
+        self.flush_interval = flush_interval
+        self._shape = (width,) if width else ()
+        self._dtype = np.dtype(dtype)
+        self._row_bytes = self._dtype.itemsize * (width or 1)
+        self._size = 0
+        self._map = None
+        self._released = 0  # bytes of data at the start of the map that were already flushed and handed back
+        self._last_flush = time.monotonic()
+
+        if os.path.exists(path) and os.path.getsize(path) >= _MAPPED_HEADER_SIZE:
+            self._open_existing()
+        else:
+            self._create(path, capacity)
+            self._remap()
+
+    def _create(self, path, capacity):
+        with open(path, "wb") as f:
+            f.write(self._header(0))
+            f.truncate(_MAPPED_HEADER_SIZE + capacity * self._row_bytes)
+
+    def _open_existing(self):
+        with open(self.path, "rb") as f:
+            magic, dtype, width, size = _MAPPED_HEADER.unpack(f.read(_MAPPED_HEADER.size))
+        if magic != _MAPPED_MAGIC:
+            raise ValueError(f"{self.path} isn't a calimu point file")
+        dtype = np.dtype(dtype.rstrip(b"\0").decode())
+        if dtype != self._dtype or width != (self.width or 0):
+            raise ValueError(
+                f"{self.path} holds {dtype.str} points of width {width}, "
+                f"not {self._dtype.str} of width {self.width or 0}"
+            )
+        self._remap()
+        # a count past the end of the file would mean the header's from a bigger file; only trust what's there
+        self._size = min(size, self.capacity)
+
+    def _header(self, size):
+        return _MAPPED_HEADER.pack(_MAPPED_MAGIC, self._dtype.str.encode(), self.width or 0, size).ljust(
+            _MAPPED_HEADER_SIZE, b"\0"
+        )
+
+    def _remap(self):
+        # views of the old map keep it alive on their own, so it's just dropped here rather than closed
+        with open(self.path, "r+b") as f:
+            self._map = mmap.mmap(f.fileno(), 0)
+        self._released = 0
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def capacity(self):
+        return (len(self._map) - _MAPPED_HEADER_SIZE) // self._row_bytes
+
+    @property
+    def nbytes(self):
+        return len(self._map) - _MAPPED_HEADER_SIZE
+
+    def __len__(self):
+        return self._size
+
+    def _data(self, n):
+        return np.frombuffer(self._map, self._dtype, n * (self.width or 1), _MAPPED_HEADER_SIZE).reshape(
+            (n,) + self._shape
+        )
+
+    def _reserve(self, n):
+        if n <= self.capacity:
+            return
+        capacity = max(self.capacity, 1)
+        while capacity < n:
+            capacity *= 2
+        self._map.flush()
+        with open(self.path, "r+b") as f:
+            f.truncate(_MAPPED_HEADER_SIZE + capacity * self._row_bytes)
+        self._remap()
+
+    def append(self, points):
+        points = np.asarray(points).reshape((-1,) + self._shape)
+        n = points.shape[0]
+        self._reserve(self._size + n)
+        data = self._data(self._size + n)
+        data[self._size :] = points
+        self._size += n
+        # the count goes in after the points, so a header never counts points that aren't there
+        self._map[: _MAPPED_HEADER.size] = self._header(self._size)[: _MAPPED_HEADER.size]
+        if time.monotonic() - self._last_flush > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._map.flush()
+        self._last_flush = time.monotonic()
+        # flushed pages can be read back from the file whenever they're needed, so let the OS drop them
+        if hasattr(self._map, "madvise") and hasattr(mmap, "MADV_DONTNEED"):
+            end = (_MAPPED_HEADER_SIZE + self._size * self._row_bytes) // mmap.PAGESIZE * mmap.PAGESIZE
+            if end > self._released:
+                self._map.madvise(mmap.MADV_DONTNEED, self._released, end - self._released)
+                self._released = end
+
+    def view(self):
+        v = self._data(self._size)
+        v.flags.writeable = False
+        return v
+
+    def clear(self):
+        # a new file replaces the old one, so views of the old points stay valid. Windows won't replace a mapped file,
+        # so there the old one is reused, and old views see new points overwrite theirs.
+        capacity = min(self.capacity, 1 << 16)
+        tmp = self.path + ".new"
+        self._create(tmp, capacity)
+        try:
+            os.replace(tmp, self.path)
+        except OSError:
+            os.remove(tmp)
+            self._map[:_MAPPED_HEADER_SIZE] = self._header(0)
+        self._remap()
+        self._size = 0
+
+    def close(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map = None
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.view()
+        return self.view().astype(dtype)
+
+    def __getitem__(self, item):
+        return self.view()[item]
+
+
+class BatchHandoff(object):
+    """Hands point batches from one producer thread to one consumer thread.
+
+    The producer put()s whole batches and the consumer swap()s out everything pending at once. The lock is only held
+    long enough to append to or replace a list, so neither side ever waits on the other's work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_count = 0
+        self.last_swap_count = 0
+
+    def __len__(self):
+        return self._pending_count
+
+    def put(self, tag, points):
+        with self._lock:
+            self._pending.append((tag, points))
+            self._pending_count += len(points)
+
+    def discard(self, tag):
+        """Drop the pending batches of one tag, e.g. when that sensor's points are cleared."""
+        with self._lock:
+            self._pending = [(t, p) for t, p in self._pending if t != tag]
+            self._pending_count = sum(len(p) for _, p in self._pending)
+
+    def swap(self):
+        """Take every pending (tag, points) batch. last_swap_count is set to how many points they held."""
+        with self._lock:
+            batches, self._pending = self._pending, []
+            self.last_swap_count, self._pending_count = self._pending_count, 0
+        return batches
@@ -1,13 +1,18 @@
 # Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
 
+import collections
+import concurrent.futures
 import copy
 import time
+from typing import Optional
 
 import serial as pyserial
 import serial.tools
 import serial.tools.list_ports
 
 from calimu.imu.imu import IMU
+from calimu.imu.recording import RecordingSerial, ReplaySerial  # also lets connect() take replay:// urls
+from calimu.imu.telemetry import StreamTelemetry
 
 
 def list_ports():
@@ -19,6 +24,52 @@ def list_ports():
     return s
 
 
+PortScan = collections.namedtuple("PortScan", ["port", "description", "is_imu", "error", "seconds"])
+
+
+def _probe_port(port, description, imu_class, baud, timeout):
+    t0 = time.monotonic()
+    connection = None
+    try:
+        port_config = copy.deepcopy(ComImu.DEFAULT_PORT_CONFIG)
+        port_config["baudrate"] = baud
+        connection = pyserial.serial_for_url(port, do_not_open=True, **port_config)
+        connection.dtr = False  # set before opening, so boards that reset on DTR (arduinos) don't, where the os allows
+        connection.open()
+        is_imu, error = imu_class.identify(connection, timeout), None
+    except (pyserial.SerialException, OSError, ValueError) as e:
+        is_imu, error = False, e  # busy, gone, or not a serial port at all
+    finally:
+        if connection is not None:
+            connection.close()
+    return PortScan(port, description, is_imu, error, time.monotonic() - t0)
+
+
+def scan_ports(ports=None, imu_class=None, baud=None, timeout=None, workers=16):
+    """Probe ports in parallel, and report which ones answer like imu_class (MC6470IMU by default).
+
+    ports defaults to everything list_ports() finds. Returns a PortScan per port, in the same order. timeout defaults
+    to imu_class.DEFAULT_READY_TIMEOUT, long enough for a board that resets on open anyway (linux raises DTR on open).
+    """
+    if imu_class is None:
+        from calimu.imu.devices.mc6470 import MC6470IMU
+
+        imu_class = MC6470IMU
+    if baud is None:
+        baud = imu_class.DEFAULT_BAUDRATE
+    if timeout is None:
+        timeout = imu_class.DEFAULT_READY_TIMEOUT
+    if ports is None:
+        ports = [(p.device, p.description) for p in sorted(serial.tools.list_ports.comports())]
+    else:
+        ports = [(p, "") for p in ports]
+    if not ports:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(min(workers, len(ports))) as pool:
+        futures = [pool.submit(_probe_port, port, desc, imu_class, baud, timeout) for port, desc in ports]
+        return [f.result() for f in futures]
+
+
 # stfu pycharm: this subclass of an abstract class is also meant to be an abstract class
 # noinspection PyAbstractClass
 class ComImu(IMU):
@@ -35,14 +86,23 @@ class ComImu(IMU):
         "rtscts": False,
     }
 
+    # connecting waits up to this long for the device to say anything, since arduinos reset when their port opens
+    DEFAULT_READY_TIMEOUT = 2.5
+    # sent every READY_PROBE_INTERVAL seconds while waiting, for devices that only talk when talked to
+    READY_PROBE: Optional[bytes] = None
+    READY_PROBE_INTERVAL = 0.1
+    # once ready, answers keep being read until the device is quiet for this long, then dropped
+    READY_SETTLE = 0.02
+
     def __init__(self, port=None, baud=DEFAULT_BAUDRATE, **kwargs):
         self.connection = None
+        self.telemetry = StreamTelemetry()
         if port is not None:
-            self.connection = self._get_serial(port, baud, **kwargs)
+            self.connect(port, baud, **kwargs)
         self.end_writes = []
 
-    @staticmethod
-    def _get_serial(port=None, baud=DEFAULT_BAUDRATE, **kwargs) -> pyserial.Serial:
+    @classmethod
+    def _get_serial(cls, port=None, baud=DEFAULT_BAUDRATE, ready_timeout=None, **kwargs) -> pyserial.Serial:
         if port is None:
             s = ["\t", list_ports()]
             s_all = "\n\t".join(s)
@@ -57,12 +117,67 @@ class ComImu(IMU):
             proc = port
             proc.timeout = ComImu.DEFAULT_PORT_CONFIG["timeout"]  # set read timeout
 
-        time.sleep(2)  # wait for arduino to start up
+        if ready_timeout is None:
+            ready_timeout = cls.DEFAULT_READY_TIMEOUT
+        # wait for arduino to start up. If it never says anything, carry on anyway, like the old fixed wait did
+        if cls.wait_ready(proc, ready_timeout) and not isinstance(proc, ReplaySerial):
+            # boot messages and probe answers. Replays keep theirs, since recordings start after them.
+            cls._drop_ready_answers(proc)
         return proc
 
+    @classmethod
+    def _drop_ready_answers(cls, connection):
+        # wait_ready returns on the first byte, so the rest of that answer, and answers to probes sent before it, are
+        # still on their way. Read them all, or the first gather would count them as parse failures.
+        timeout = connection.timeout
+        try:
+            connection.timeout = cls.READY_PROBE_INTERVAL
+            connection.read_until(b"\n")
+            connection.timeout = cls.READY_SETTLE
+            deadline = time.monotonic() + cls.READY_PROBE_INTERVAL
+            while time.monotonic() < deadline and connection.read_until(b"\n"):
+                pass
+        finally:
+            connection.timeout = timeout
+        connection.reset_input_buffer()
+
+    @classmethod
+    def wait_ready(cls, connection, timeout):
+        """Wait until the device sends anything, sending READY_PROBE meanwhile. Returns whether it did in time."""
+        deadline = time.monotonic() + timeout
+        next_probe = 0.0
+        while True:
+            now = time.monotonic()
+            if cls.READY_PROBE is not None and now >= next_probe:
+                connection.write(cls.READY_PROBE)
+                next_probe = now + cls.READY_PROBE_INTERVAL
+            if connection.in_waiting:
+                return True
+            if now >= deadline:
+                return False
+            time.sleep(0.005)
+
+    @classmethod
+    def identify(cls, connection, timeout):
+        """Whether the device on connection looks like one of these, for scan_ports(). Devices override this to
+        check for their own protocol, this one only checks that something answers."""
+        return cls.wait_ready(connection, timeout)
+
     def connect(self, port, baud=DEFAULT_BAUDRATE, **kwargs):
         self.connection = self._get_serial(port, baud, **kwargs)
+        self.telemetry.count_connect()
 
     def disconnect(self):
         self.connection.close()
         self.connection = None
+
+    def start_recording(self, path):
+        """Record every byte read from the connection to path, until stop_recording() or disconnect()."""
+        if self.connection is None:
+            raise RuntimeError("IMU should be connected to record it.")
+        self.stop_recording()
+        self.connection = RecordingSerial(self.connection, path)
+
+    def stop_recording(self):
+        if isinstance(self.connection, RecordingSerial):
+            self.connection = self.connection.stop_recording()
@@ -0,0 +1,454 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""A software MC6470, for load testing without hardware.
+
+MC6470Emulator speaks the same serial protocol as the firmware MC6470IMU talks to:
+
+    a/b, c/d, e/f   start/stop the mag, acc and orientation loops
+    C/E, D/F        turn the acc and mag sample output off/on (the loops keep running)
+    B/T             binary frames (calimu.imu.protocol) / text lines for samples
+    G, J + floats   mag offset (3 float32) and matrix (9 float32)
+    M, P + floats   acc offset and matrix
+    K/H, Q/N        print the mag/acc offset and matrix
+
+The device spins through every orientation, so the sensors trace out a sphere, which is then distorted by hard and soft
+iron, plus noise. The uploaded calibration is applied to every sample the way the firmware does it, mat @ (raw + off),
+so fitting, uploading and gathering again should give back a sphere.
+
+It can be used through:
+  - EmulatorSerial, a pyserial port: ComImu.connect(EmulatorSerial(emulator=MC6470Emulator(rate=5000))), or the url
+    emulator://?rate=5000&noise=2&corruption=0.01&seed=1 once calimu.imu.recording has been imported.
+  - PtyEmulator, which serves it on a pseudo terminal any program can open like a real port (not on windows):
+    python -m calimu.imu.devices.emulator --rate 5000
+"""
+
+import argparse
+import os
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+from serial.serialutil import PortNotOpenError, SerialBase, SerialException
+
+from calimu.imu.protocol import encode_frames
+
+# offset and matrix payloads after G/M and J/P
+_PAYLOADS = {ord("G"): 12, ord("J"): 36, ord("M"): 12, ord("P"): 36}
+
+# orientation rows are printed as integers, since that's what the readers take
+ORIENT_SCALE = 1000
+
+# relative spin rates around z, y and x. Irrational ratios, so the orientations never repeat and cover the sphere
+_SPIN_RATIOS = np.array([1.0, 0.6180339887, 0.4142135624])
+
+
+def _random_distortion(rng, radius, hard, soft):
+    mat = np.eye(3) + rng.uniform(-soft, soft, (3, 3))
+    return rng.uniform(-hard, hard, 3) * radius, (mat + mat.T) / 2
+
+
+def _rotations(t, spin):
+    # (k, 3, 3) rotation matrices Rz @ Ry @ Rx of the device at times t
+    angles = spin * np.asarray(t, dtype=np.float64)[:, np.newaxis] * _SPIN_RATIOS
+    c, s = np.cos(angles), np.sin(angles)
+    one, zero = np.ones_like(t, dtype=np.float64), np.zeros_like(t, dtype=np.float64)
+    rz = np.stack([c[:, 0], -s[:, 0], zero, s[:, 0], c[:, 0], zero, zero, zero, one], axis=1).reshape(-1, 3, 3)
+    ry = np.stack([c[:, 1], zero, s[:, 1], zero, one, zero, -s[:, 1], zero, c[:, 1]], axis=1).reshape(-1, 3, 3)
+    rx = np.stack([one, zero, zero, zero, c[:, 2], -s[:, 2], zero, s[:, 2], c[:, 2]], axis=1).reshape(-1, 3, 3)
+    return rz @ ry @ rx
+
+
+class MC6470Emulator(object):
+    """The MC6470 firmware's serial protocol, generating samples at rate per second per sensor.
+
+    rate=None generates batch_size samples every time output is asked for, as fast as it's read. Hard and soft iron
+    default to a random distortion from seed; mag_hard_iron is a 3 vector of counts and mag_soft_iron a 3×3 matrix,
+    same for acc. corruption is the chance each line (or binary frame) gets garbled, truncated or loses a byte. spin is
+    how fast the device turns, in radians per second around its fastest axis.
+
+    write() takes bytes from the host, output() returns the bytes the device has sent since the last call.
+    """
+
+    def __init__(
+        self,
+        rate=100.0,
+        noise=2.0,
+        mag_radius=500.0,
+        acc_radius=1000.0,
+        mag_hard_iron=None,
+        mag_soft_iron=None,
+        acc_hard_iron=None,
+        acc_soft_iron=None,
+        corruption=0.0,
+        spin=10.0,
+        seed=None,
+        batch_size=4096,
+    ):
+        self.rate = rate
+        self.noise = noise
+        self.corruption = corruption
+        self.spin = spin
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+
+        self.radius = {"m": mag_radius, "a": acc_radius}
+        mag = _random_distortion(self.rng, mag_radius, 0.4, 0.2)
+        acc = _random_distortion(self.rng, acc_radius, 0.05, 0.02)
+        self.hard_iron = {
+            "m": mag[0] if mag_hard_iron is None else np.asarray(mag_hard_iron, dtype=np.float64),
+            "a": acc[0] if acc_hard_iron is None else np.asarray(acc_hard_iron, dtype=np.float64),
+        }
+        self.soft_iron = {
+            "m": mag[1] if mag_soft_iron is None else np.asarray(mag_soft_iron, dtype=np.float64),
+            "a": acc[1] if acc_soft_iron is None else np.asarray(acc_soft_iron, dtype=np.float64),
+        }
+        # the field and gravity in world coordinates, which the device spins around
+        self.world = {"m": np.array([0.6, 0.0, -0.8]), "a": np.array([0.0, 0.0, -1.0])}
+
+        # firmware state
+        self.loops = {"m": False, "a": False, "o": False}
+        self.display = {"m": True, "a": True}
+        self.binary = False
+        self.offsets = {"m": np.zeros(3), "a": np.zeros(3)}
+        self.matrices = {"m": np.eye(3), "a": np.eye(3)}
+
+        self.sent = {"m": 0, "a": 0, "o": 0}
+        self.corrupted = 0
+        self._commands = bytearray()
+        self._out = bytearray()
+        self._tick = 0
+        self._seq = 0
+        self._t0 = None
+
+    # host to device
+
+    def write(self, data):
+        self._commands += data
+        while self._commands:
+            c = self._commands[0]
+            size = _PAYLOADS.get(c, 0)
+            if len(self._commands) < 1 + size:
+                break  # wait for the rest of the payload
+            payload = bytes(self._commands[1 : 1 + size])
+            del self._commands[: 1 + size]
+            self._command(chr(c), payload)
+        return len(data)
+
+    def _command(self, c, payload):
+        if c in "abcdef":
+            self.loops["mmaaoo"["abcdef".index(c)]] = c in "ace"
+        elif c in "CDEF":
+            self.display["amam"["CDEF".index(c)]] = c in "EF"
+        elif c in "BT":
+            self.binary = c == "B"
+        elif c in "GM":
+            self.offsets["m" if c == "G" else "a"] = np.frombuffer(payload, dtype=np.float32).astype(np.float64)
+        elif c in "JP":
+            mat = np.frombuffer(payload, dtype=np.float32).reshape(3, 3).astype(np.float64)
+            self.matrices["m" if c == "J" else "a"] = mat
+        elif c in "KQ":
+            t = "m" if c == "K" else "a"
+            self._out += (f"{t} offsets: " + ", ".join(f"{v:.6f}" for v in self.offsets[t]) + "\r\n").encode()
+        elif c in "HN":
+            t = "m" if c == "H" else "a"
+            rows = "".join("\t" + ", ".join(f"{v:.6f}" for v in row) + "\r\n" for row in self.matrices[t])
+            self._out += f"{t} matrix:\r\n{rows}".encode()
+        # anything else is ignored, like the firmware does
+
+    # device to host
+
+    def due(self, now=None):
+        """How many sample ticks are due but haven't been generated yet."""
+        if self.rate is None:
+            return self.batch_size
+        now = time.monotonic() if now is None else now
+        if self._t0 is None:
+            self._t0 = now
+        return int((now - self._t0) * self.rate) - self._tick
+
+    def next_due(self):
+        """Seconds until the next tick is due."""
+        if self.rate is None or self._t0 is None:
+            return 0.0
+        return max(0.0, self._t0 + (self._tick + 1) / self.rate - time.monotonic())
+
+    def output(self, now=None):
+        """Every byte the device has sent up to now."""
+        k = min(self.due(now), self.batch_size)
+        if k > 0:
+            self._generate(k)
+        out = bytes(self._out)
+        self._out.clear()
+        return out
+
+    def sample(self, sensor, t):
+        """What sensor ("m" or "a") reads at times t, before the uploaded calibration: a (k, 3) float array."""
+        true = np.einsum("kji,j->ki", _rotations(t, self.spin), self.world[sensor]) * self.radius[sensor]
+        raw = true @ self.soft_iron[sensor].T + self.hard_iron[sensor]
+        if self.noise:
+            raw += self.rng.normal(scale=self.noise, size=raw.shape)
+        return raw
+
+    def calibrate(self, sensor, raw):
+        """Apply the uploaded offsets to raw samples like the firmware: mat @ (raw + offset)."""
+        return (raw + self.offsets[sensor]) @ self.matrices[sensor].T
+
+    def _generate(self, k):
+        ticks = np.arange(self._tick, self._tick + k)
+        self._tick += k
+        t = ticks / (self.rate if self.rate else 1000.0)  # rate=None still moves like a 1kHz device
+
+        sensors = [s for s in ("m", "a") if self.loops[s] and self.display[s]]
+        samples = {s: np.rint(self.calibrate(s, self.sample(s, t))).astype(np.int64) for s in sensors}
+        if sensors:
+            if self.binary:
+                self._out += self._frames(sensors, samples, k)
+            else:
+                self._out += self._lines(sensors, samples, k)
+        for s in sensors:
+            self.sent[s] += k
+        if self.loops["o"]:
+            self._out += self._orient_lines(t)
+            self.sent["o"] += k
+
+    def _lines(self, sensors, samples, k):
+        names = {"m": "mag", "a": "acc"}
+        cols = [samples[s].tolist() for s in sensors]
+        lines = [
+            f"Got {names[s]} data: [{x}], [{y}], [{z}]\r\n".encode()
+            for i in range(k)
+            for s, col in zip(sensors, cols)
+            for x, y, z in (col[i],)
+        ]
+        return b"".join(self._corrupt_lines(lines))
+
+    def _orient_lines(self, t):
+        rows = np.rint(_rotations(t, self.spin) * ORIENT_SCALE).astype(np.int64).tolist()
+        lines = []
+        for r in rows:
+            lines.append(b"Got orient:\r\n")
+            lines.extend(f"\t{x}, {y}, {z}\r\n".encode() for x, y, z in r)
+        return b"".join(self._corrupt_lines(lines))
+
+    def _corrupt_lines(self, lines):
+        if not self.corruption:
+            return lines
+        for i in np.flatnonzero(self.rng.random(len(lines)) < self.corruption).tolist():
+            line = lines[i]
+            kind = self.rng.integers(3)
+            pos = int(self.rng.integers(len(line) - 2))
+            if kind == 0:  # garbled byte
+                line = line[:pos] + bytes([int(self.rng.integers(32, 127))]) + line[pos + 1 :]
+            elif kind == 1:  # lost byte
+                line = line[:pos] + line[pos + 1 :]
+            else:  # cut off, so it runs into the next line
+                line = line[:pos]
+            lines[i] = line
+            self.corrupted += 1
+        return lines
+
+    def _frames(self, sensors, samples, k):
+        # interleaved like the text lines: m, a, m, a...
+        tags = "".join(sensors) * k
+        xyz = np.stack([samples[s] for s in sensors], axis=1).reshape(-1, 3)
+        xyz = np.clip(xyz, -0x8000, 0x7FFF)
+        seq = np.arange(self._seq, self._seq + xyz.shape[0])
+        self._seq += xyz.shape[0]
+        frames = bytearray(encode_frames(list(tags), xyz, seq))
+        if self.corruption:
+            size = len(frames) // xyz.shape[0]
+            for i in np.flatnonzero(self.rng.random(xyz.shape[0]) < self.corruption).tolist():
+                frames[i * size + int(self.rng.integers(size))] ^= 1 << int(self.rng.integers(8))
+                self.corrupted += 1
+        return bytes(frames)
+
+
+def _emulator_kwargs(query):
+    kwargs = {}
+    for option, values in urllib.parse.parse_qs(query).items():
+        value = values[0]
+        if option == "rate":
+            kwargs["rate"] = None if value in ("max", "0") else float(value)
+        elif option in ("noise", "corruption", "spin", "mag_radius", "acc_radius"):
+            kwargs[option] = float(value)
+        elif option in ("seed", "batch_size"):
+            kwargs[option] = int(value)
+        else:
+            raise SerialException(f"unknown emulator:// option {option!r}")
+    return kwargs
+
+
+class EmulatorSerial(SerialBase):
+    """A pyserial port with an MC6470Emulator on the other end.
+
+    As a url: emulator://?rate=5000&noise=2&corruption=0.01&seed=1 (rate=max for as fast as it's read)
+    """
+
+    def __init__(self, port=None, emulator=None, **kwargs):
+        self.emulator = emulator
+        self._buffer = bytearray()
+        if port is None and emulator is not None:
+            port = "emulator://"
+        super().__init__(port, **kwargs)
+
+    def open(self):
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self.emulator is None:
+            if not self._port.lower().startswith("emulator://"):
+                raise SerialException(f"{self._port} isn't an emulator:// url")
+            self.emulator = MC6470Emulator(**_emulator_kwargs(self._port.partition("?")[2]))
+        self._buffer = bytearray()
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+        self._buffer = bytearray()
+
+    def _reconfigure_port(self):
+        pass
+
+    def _update_dtr_state(self):
+        pass
+
+    def _update_rts_state(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        # only make more when everything made so far was read, or at rate=max this keeps a whole batch of old samples
+        if not self._buffer:
+            self._buffer += self.emulator.output()
+        return len(self._buffer)
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise PortNotOpenError()
+        deadline = None if self._timeout is None else time.monotonic() + self._timeout
+        if len(self._buffer) < size:
+            self._buffer += self.emulator.output()
+        while len(self._buffer) < size:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+            wait = self.emulator.next_due()
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            time.sleep(max(wait, 0.0005))  # nothing at all might be coming if every loop is off
+            self._buffer += self.emulator.output()
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def write(self, data):
+        if not self.is_open:
+            raise PortNotOpenError()
+        return self.emulator.write(bytes(data))
+
+    def reset_input_buffer(self):
+        self._buffer.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    @property
+    def cts(self):
+        return True
+
+    @property
+    def dsr(self):
+        return True
+
+    @property
+    def ri(self):
+        return False
+
+    @property
+    def cd(self):
+        return True
+
+
+class PtyEmulator(object):
+    """Serves an MC6470Emulator on a pseudo terminal from a background thread. Open port like any serial port.
+
+    Output that the host doesn't read gets dropped once more than max_pending bytes are waiting, like a device
+    whose transmit buffer overflowed, and is counted in dropped_bytes.
+    """
+
+    def __init__(self, emulator, max_pending=1 << 20):
+        import tty
+
+        self.emulator = emulator
+        self.max_pending = max_pending
+        self.dropped_bytes = 0
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)  # no echo, no newline translation, so binary frames get through
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        import select
+
+        pending = bytearray()
+        while not self._stop.is_set():
+            wait = min(self.emulator.next_due(), 0.01)
+            readable, _, _ = select.select([self.master], [], [], wait if not pending else 0.001)
+            if readable:
+                try:
+                    self.emulator.write(os.read(self.master, 4096))
+                except (BlockingIOError, OSError):
+                    pass
+            out = self.emulator.output()
+            if len(pending) + len(out) > self.max_pending:
+                self.dropped_bytes += len(out)
+            else:
+                pending += out
+            if pending:
+                try:
+                    del pending[: os.write(self.master, pending)]
+                except BlockingIOError:
+                    pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve an emulated MC6470 on a pseudo terminal.")
+    parser.add_argument("--rate", type=float, default=100.0, help="samples per second per sensor, 0 for no limit")
+    parser.add_argument("--noise", type=float, default=2.0, help="standard deviation of the noise, in counts")
+    parser.add_argument("--corruption", type=float, default=0.0, help="chance each line gets corrupted")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    emulator = MC6470Emulator(args.rate or None, args.noise, corruption=args.corruption, seed=args.seed)
+    with PtyEmulator(emulator) as pty:
+        print(f"emulated MC6470 on {pty.port}, ctrl+c to stop", flush=True)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
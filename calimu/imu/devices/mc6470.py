@@ -1,14 +1,24 @@
 # Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
 
+import time
+
 import numpy as np
 
 from calimu.imu.com_imu import ComImu
+from calimu.imu.reader import BinarySampleReader, TextOrientationReader, TextSampleReader
 import serial
 
 
 # stfu pycharm: I raised errors instead of using @abc.abstractmethod so that I could implement only the needed methods.
 # noinspection PyAbstractClass
 class MC6470IMU(ComImu):
+    READY_PROBE = b"K"  # prints the mag offsets, so any running firmware answers it
+
+    def __init__(self, port=None, baud=ComImu.DEFAULT_BAUDRATE, binary=False, **kwargs):
+        # binary: ask the firmware for framed binary samples (see calimu.imu.protocol) instead of text lines
+        self.binary = binary
+        super().__init__(port, baud, **kwargs)
+
     def set_accelerometer_offsets(self, mat4x4: np.ndarray, avg_scale: float):
         if self.connection is None or (not self.connection.is_open):
             raise RuntimeError("IMU should be connected to set offsets.")
@@ -49,69 +59,87 @@ class MC6470IMU(ComImu):
         self.connection.write(byte_msg)
 
     def mag_accel_iter(self):
-        if self.connection is None or (not self.connection.is_open):
-            return
+        for batch in self.mag_accel_batch_iter():
+            for t, xyz in batch.items():
+                for x, y, z in xyz.tolist():
+                    yield t, x, y, z
+
+    @classmethod
+    def identify(cls, connection, timeout):
+        """Turn the mag loop on and see if a mag sample comes back within timeout seconds."""
+        reader = TextSampleReader()
+        deadline = time.monotonic() + timeout
+        try:
+            connection.write(b"T")  # in case it was left sending binary
+            while time.monotonic() < deadline:
+                connection.write(b"a")  # again every read, in case the last one went out while it was booting
+                if reader.read(connection)["m"].shape[0]:
+                    return True
+            return False
+        finally:
+            connection.write(b"b")
+
+    def sample_reader(self):
+        """A fresh reader for the samples start_sample_loops() turns on."""
+        return BinarySampleReader(self.telemetry) if self.binary else TextSampleReader(self.telemetry)
+
+    def start_sample_loops(self):
+        if self.binary:
+            self.connection.write(b"B")  # binary frames
         self.connection.write(b"a")  # mag loop
         self.connection.write(b"c")  # acc loop
 
+    def stop_sample_loops(self):
+        try:
+            self.connection.write(b"b")  # stop mag loop
+            self.connection.write(b"d")  # stop acc loop
+            if self.binary:
+                self.connection.write(b"T")  # back to text
+        except serial.SerialException:
+            pass  # already disconnected it seems
+
+    def mag_accel_batch_iter(self):
+        """Yield {"m": (k, 3) array, "a": (k, 3) array} with every sample that arrived since the last read.
+        Batches may be empty if nothing came in before the read timeout."""
+        if self.connection is None or (not self.connection.is_open):
+            return
+        reader = self.sample_reader()
+        self.start_sample_loops()
+
         try:
             while True:
-                line = self.connection.readline()
-                print(line)
-                try:
-                    parts = line.split(b"[")
-                    x = parts[1][0:-3]
-                    y = parts[2][0:-3]
-                    z = parts[3][0:-3]
-                except IndexError as ie:
-                    print(ie)  # transmission error, line garbled
-                    continue
-                try:
-                    if b"Got mag data: " in line:
-                        yield "m", int(x), int(y), int(z)
-                    elif b"Got acc data: " in line:
-                        yield "a", int(x), int(y), int(z)
-                except ValueError as ve:
-                    print(ve)  # another screw up: number was empty
-                    continue
+                yield reader.read(self.connection)
         finally:
-            try:
-                self.connection.write(b"b")  # stop mag loop
-                self.connection.write(b"d")  # stop acc loop
-            except serial.SerialException:
-                pass  # already disconnected it seems
+            self.stop_sample_loops()
 
-    def orientation_iter(self):
+    def orientation_reader(self):
+        return TextOrientationReader(self.telemetry)
+
+    def start_orientation_loops(self):
         self.connection.write(b"C")  # turn off acc display
         self.connection.write(b"D")  # turn off mag display
         self.connection.write(b"a")  # mag loop
         self.connection.write(b"c")  # acc loop
         self.connection.write(b"e")  # orient loop
 
-        orient = np.eye(3)
-        i = 0
+    def stop_orientation_loops(self):
+        self.connection.write(b"b")  # stop mag loop
+        self.connection.write(b"d")  # stop acc loop
+        self.connection.write(b"f")  # stop orient loop
+        self.connection.write(b"E")  # turn on acc display
+        self.connection.write(b"F")  # turn on mag display
+
+    def orientation_batch_iter(self):
+        """Yield (k, 3, 3) arrays of every orientation that arrived since the last read."""
+        self.start_orientation_loops()
+
+        reader = self.orientation_reader()
         try:
             while True:
-                line = self.connection.readline()
-                try:
-                    if line == b"Got orient:\r\n":
-                        orient = np.eye(3)
-                        i = 0
-                    else:
-                        line = line[1:-2]  # trim off start \t and end \r\n
-                        nums = line.split(b", ")
-                        orient[i, :] = [int(n) for n in nums]
-                        i = (i + 1) % 3
-                        if i == 0:  # looped back around. So it was fully filled.
-                            yield orient
-                except ValueError as ve:
-                    print(ve)
-                except IndexError as ie:
-                    print(ie)
-
+                yield reader.read(self.connection)
         finally:
-            self.connection.write(b"b")  # stop mag loop
-            self.connection.write(b"d")  # stop acc loop
-            self.connection.write(b"f")  # stop orient loop
-            self.connection.write(b"E")  # turn on acc display
-            self.connection.write(b"F")  # turn on mag display
+            self.stop_orientation_loops()
+
+    def orientation_iter(self):
+        for orients in self.orientation_batch_iter():
+            yield from orients
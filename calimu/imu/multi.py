@@ -0,0 +1,183 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""Gather from many IMUs at once, for things like full body trackers, with one thread for all of them.
+
+MultiIMUReader waits on every device's file descriptor with a single selector (epoll on linux), and reads only the
+devices that have data, so dozens of ports cost one thread instead of one each. Every device gets its own
+IMUPointStore for its points, and keeps its own telemetry on its IMU.
+
+Connections without a file descriptor, like EmulatorSerial, ReplaySerial, or any port on windows, still work: they're
+checked with in_waiting on every poll instead, which makes the loop poll every few milliseconds while there are any.
+"""
+
+import selectors
+import threading
+import time
+
+import serial
+
+from calimu.imu.store import IMUPointStore
+from calimu.imu.util import StoppableThread
+
+
+def _fileno(connection):
+    try:
+        return connection.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class _Device(object):
+    def __init__(self, name, imu, store):
+        self.name = name
+        self.imu = imu
+        self.store = store
+        self.reader = imu.sample_reader()
+        self.fd = None
+        self.error = None
+        self.timeout = None
+        self.running = False  # sensor loops on and registered, so it's only ever stopped once
+
+
+class MultiIMUReader(StoppableThread):
+    """Reads samples from any number of IMUs into one IMUPointStore each, from one thread.
+
+    Run it as a thread with start(), or call poll() from a loop of your own. add() and remove() can be called from
+    any thread, and take effect on the next poll.
+    """
+
+    def __init__(self, poll_interval=0.05, fallback_interval=0.002):
+        super().__init__(daemon=True)
+        self.poll_interval = poll_interval
+        self.fallback_interval = fallback_interval
+        self.selector = selectors.DefaultSelector()
+        self.devices = {}
+        self.failed = {}  # name: exception, for devices that were dropped after a read error
+        self._failed_devices = {}
+        self._polled = []  # devices without a file descriptor
+        self._changes = []
+        self._lock = threading.Lock()
+
+    def add(self, name, imu, store=None, **store_kwargs):
+        """Start gathering from a connected IMU. Returns its store, which is made with store_kwargs if not given."""
+        if store is None:
+            store = IMUPointStore(imu, **store_kwargs)
+        device = _Device(name, imu, store)
+        with self._lock:
+            if name in self.devices:
+                raise ValueError(f"There's already a device called {name!r}")
+            self.devices[name] = device
+            self._changes.append(("add", device))
+        return store
+
+    def remove(self, name):
+        """Stop gathering from a device and return its store. Failed devices are already stopped, so just forgotten."""
+        with self._lock:
+            if name not in self.devices and name in self.failed:
+                del self.failed[name]
+                return self._failed_devices.pop(name).store
+            device = self.devices.pop(name)
+            self._changes.append(("remove", device))
+        return device.store
+
+    def stores(self):
+        with self._lock:
+            return {name: d.store for name, d in self.devices.items()}
+
+    def telemetry(self):
+        """Telemetry snapshots of every device, by name."""
+        return {name: d.imu.telemetry.snapshot() for name, d in list(self.devices.items())}
+
+    def total_samples(self):
+        return sum(d.imu.telemetry.total_samples for d in list(self.devices.values()))
+
+    def __apply_changes(self):
+        with self._lock:
+            changes, self._changes = self._changes, []
+        for op, device in changes:
+            if op == "add":
+                device.running = True
+                # only ready devices get read, so reads shouldn't wait on the rest of what in_waiting promised
+                device.timeout = device.imu.connection.timeout
+                device.imu.connection.timeout = 0
+                device.imu.start_sample_loops()
+                device.fd = _fileno(device.imu.connection)
+                if device.fd is None:
+                    self._polled.append(device)
+                else:
+                    self.selector.register(device.fd, selectors.EVENT_READ, device)
+            elif device.running:
+                device.running = False
+                self.__unregister(device)
+                device.imu.stop_sample_loops()
+                device.imu.connection.timeout = device.timeout
+
+    def __unregister(self, device):
+        if device in self._polled:
+            self._polled.remove(device)
+        elif device.fd is not None and device.fd in self.selector.get_map():
+            self.selector.unregister(device.fd)
+
+    def __read(self, device):
+        try:
+            batch = device.reader.read(device.imu.connection)
+        except (serial.SerialException, OSError) as e:
+            # unplugged or closed: drop it, and keep reading the rest
+            device.error = e
+            device.running = False
+            self.__unregister(device)
+            # in case the caller still wants to use the port, e.g. after a timeout rather than an unplug
+            try:
+                device.imu.connection.timeout = device.timeout
+            except (serial.SerialException, OSError, ValueError):
+                pass
+            with self._lock:
+                self.devices.pop(device.name, None)
+                self.failed[device.name] = e
+                self._failed_devices[device.name] = device
+            return 0
+        if batch["m"].shape[0] or batch["a"].shape[0]:
+            device.store.add_batch(batch)
+        return batch["m"].shape[0] + batch["a"].shape[0]
+
+    def poll(self, timeout=None):
+        """Read every device that has data, waiting up to timeout seconds for one to. Returns the samples read."""
+        self.__apply_changes()
+        if timeout is None:
+            timeout = self.poll_interval
+        if self._polled:
+            timeout = min(timeout, self.fallback_interval)
+
+        n = 0
+        if self.selector.get_map():
+            for key, _ in self.selector.select(timeout):
+                n += self.__read(key.data)
+        elif timeout > 0:
+            time.sleep(timeout)  # select() with nothing to wait on errors on windows
+        for device in list(self._polled):
+            try:
+                waiting = device.imu.connection.in_waiting
+            except (serial.SerialException, OSError):
+                waiting = 1  # let the read find the error
+            if waiting:
+                n += self.__read(device)
+        return n
+
+    def run(self):
+        try:
+            while not self.stopped():
+                self.poll()
+        finally:
+            with self._lock:
+                for device in self.devices.values():
+                    self._changes.append(("remove", device))
+            self.__apply_changes()
+
+    def close(self):
+        """Stop the thread if it's running, and stop the sensor loops on every device."""
+        self.stop()
+        if self.is_alive():
+            self.join()
+        else:
+            self.run()  # stopped already, so this only turns the devices off
+        self.selector.close()
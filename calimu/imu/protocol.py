@@ -0,0 +1,146 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""Binary sample frames, for links where the ascii text protocol is too slow.
+
+Every frame is 13 little-endian bytes:
+
+    sync (u2, 0xA55A) | tag (u1, b"m" or b"a") | seq (u2) | x, y, z (i2) | crc (u2)
+
+The crc is CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF) over the tag, seq and xyz bytes.
+"""
+
+import numpy as np
+
+FRAME_SYNC = 0xA55A
+FRAME_DTYPE = np.dtype(
+    [
+        ("sync", "<u2"),
+        ("tag", "u1"),
+        ("seq", "<u2"),
+        ("xyz", "<i2", (3,)),
+        ("crc", "<u2"),
+    ]
+)
+FRAME_SIZE = FRAME_DTYPE.itemsize
+
+# bytes covered by the crc: everything between the sync word and the crc itself
+_CRC_START = FRAME_DTYPE["sync"].itemsize
+_CRC_END = FRAME_SIZE - FRAME_DTYPE["crc"].itemsize
+
+_SYNC_LO = FRAME_SYNC & 0xFF
+_SYNC_HI = FRAME_SYNC >> 8
+
+
+def _crc16_table():
+    table = np.zeros(256, dtype=np.uint16)
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[i] = crc & 0xFFFF
+    return table
+
+
+_CRC16_TABLE = _crc16_table()
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE of each row of a (k, n) uint8 array, computed for all rows at once."""
+    data = np.atleast_2d(np.asarray(data, dtype=np.uint8))
+    crc = np.full(data.shape[0], 0xFFFF, dtype=np.uint16)
+    for col in range(data.shape[1]):
+        idx = ((crc >> 8) ^ data[:, col]) & 0xFF
+        crc = (crc << 8) ^ _CRC16_TABLE[idx]
+    return crc
+
+
+def encode_frames(tags, xyz, seq=None):
+    """Pack samples into frames. Mostly useful for emulating a device."""
+    xyz = np.asarray(xyz).reshape(-1, 3)
+    frames = np.zeros(xyz.shape[0], dtype=FRAME_DTYPE)
+    frames["sync"] = FRAME_SYNC
+    if isinstance(tags, (str, bytes)):
+        tags = [tags] * xyz.shape[0]
+    frames["tag"] = [ord(t) for t in tags]
+    if seq is None:
+        seq = np.arange(xyz.shape[0])
+    frames["seq"] = np.asarray(seq) & 0xFFFF
+    frames["xyz"] = xyz
+    raw = frames.view(np.uint8).reshape(-1, FRAME_SIZE)
+    frames["crc"] = crc16(raw[:, _CRC_START:_CRC_END])
+    return frames.tobytes()
+
+
+def decode_frames(buf):
+    """Decode every valid frame in buf.
+
+    Returns (frames, rest, skipped): a structured FRAME_DTYPE array, the unconsumed tail of buf that may still hold
+    the start of a frame, and the number of bytes that were thrown away while looking for frames.
+    """
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    n = raw.shape[0]
+    if n < FRAME_SIZE:
+        return np.zeros(0, dtype=FRAME_DTYPE), bytes(buf), 0
+
+    # every place a whole frame could start
+    starts = np.flatnonzero(
+        (raw[: n - FRAME_SIZE + 1] == _SYNC_LO) & (raw[1 : n - FRAME_SIZE + 2] == _SYNC_HI)
+    )
+    candidates = raw[starts[:, np.newaxis] + np.arange(FRAME_SIZE)]
+    sent_crc = candidates[:, _CRC_END:].copy().view("<u2").ravel()
+    crc_ok = crc16(candidates[:, _CRC_START:_CRC_END]) == sent_crc
+    starts = starts[crc_ok]
+    candidates = candidates[crc_ok]
+
+    # a sync word inside a valid frame's payload can't also start a valid frame, except by a crc collision
+    # compared against the last start that was kept, not the last candidate, so a dropped one can't drop the next
+    if starts.shape[0] > 1:
+        keep = np.ones(starts.shape[0], dtype=bool)
+        last = starts[0]
+        for i, start in enumerate(starts[1:].tolist(), 1):
+            if start - last < FRAME_SIZE:
+                keep[i] = False
+            else:
+                last = start
+        starts = starts[keep]
+        candidates = candidates[keep]
+
+    frames = np.ascontiguousarray(candidates).view(FRAME_DTYPE).ravel()
+
+    consumed = int(starts[-1]) + FRAME_SIZE if starts.shape[0] else 0
+    # anything in the last FRAME_SIZE-1 bytes might be a frame that hasn't fully arrived yet
+    tail = max(consumed, n - FRAME_SIZE + 1)
+    skipped = tail - FRAME_SIZE * starts.shape[0]
+    return frames, bytes(raw[tail:]), skipped
+
+
+class FrameDecoder(object):
+    """Streaming frame decoder that keeps partial frames between reads and resyncs after corrupt bytes."""
+
+    def __init__(self):
+        self.rest = b""
+        self.frames = 0
+        self.skipped_bytes = 0
+        self.dropped_frames = 0
+        self._last_seq = None
+
+    def feed(self, data):
+        """Decode everything that's complete in the stream so far. Returns a FRAME_DTYPE array."""
+        frames, self.rest, skipped = decode_frames(self.rest + data)
+        self.skipped_bytes += skipped
+        self.frames += frames.shape[0]
+        if frames.shape[0]:
+            seq = frames["seq"].astype(np.int64)
+            if self._last_seq is not None:
+                seq = np.concatenate(([self._last_seq], seq))
+            # seq is u2, so steps wrap around at 65536. A repeat or a step back (the device restarted) is a resync,
+            # not a gap of nearly 65536 dropped frames.
+            step = np.diff(seq) % 0x10000
+            resync = (step == 0) | (step >= 0x8000)
+            self.dropped_frames += int(np.sum(np.where(resync, 0, step - 1)))
+            self._last_seq = int(seq[-1])
+        return frames
+
+    def reset(self):
+        self.rest = b""
+        self._last_seq = None
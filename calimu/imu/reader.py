@@ -0,0 +1,163 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""Bulk readers that pull everything waiting on a connection at once and parse it in batches."""
+
+import re
+
+import numpy as np
+
+from calimu.imu.protocol import FrameDecoder
+from calimu.imu.telemetry import StreamTelemetry
+
+# "Got mag data: [x], [y], [z]\r\n", possibly with junk in front of it
+_SAMPLE_LINE = re.compile(
+    rb"^[^\n]*?Got (mag|acc) data: \[(-?\d+)\], \[(-?\d+)\], \[(-?\d+)\]\r?$", re.M
+)
+# "Got orient:\r\n" followed by three "\tx, y, z\r\n" rows
+_ORIENT_TOKEN = re.compile(rb"^(Got orient:)\r?$|^\t(-?\d+), (-?\d+), (-?\d+)\r?$", re.M)
+
+_TAGS = {b"mag": "m", b"acc": "a"}
+
+
+def empty_samples():
+    return np.zeros((0, 3), dtype=np.int32)
+
+
+class ChunkReader(object):
+    """Base for readers: read() takes everything in in_waiting with a single read() call, then feeds it."""
+
+    def __init__(self, telemetry=None):
+        self.telemetry = telemetry if telemetry is not None else StreamTelemetry()
+
+    def read(self, connection):
+        # blocks for at most the connection's read timeout if nothing is waiting yet
+        data = connection.read(max(1, connection.in_waiting))
+        self.telemetry.count_bytes(len(data))
+        return self.feed(data)
+
+    def feed(self, data):
+        raise NotImplementedError()
+
+
+class _LineChunkReader(ChunkReader):
+    def __init__(self, telemetry=None):
+        super().__init__(telemetry)
+        self.rest = b""
+        self.lines = 0
+        self.dropped_lines = 0
+
+    def _complete_lines(self, data):
+        # keep the partial trailing line for the next read
+        buf = self.rest + data
+        end = buf.rfind(b"\n") + 1
+        self.rest = buf[end:]
+        text = buf[:end]
+        n = text.count(b"\n")
+        self.lines += n
+        self.telemetry.count_lines(n)
+        return text
+
+
+class TextSampleReader(_LineChunkReader):
+    """Parses "Got mag data: [..]" and "Got acc data: [..]" lines.
+
+    feed() returns {"m": (k, 3) int32 array, "a": (k, 3) int32 array}. Lines that aren't samples are counted in
+    dropped_lines and in the telemetry's parse failures, and otherwise ignored.
+    """
+
+    def feed(self, data):
+        text = self._complete_lines(data)
+        found = _SAMPLE_LINE.findall(text)
+        dropped = text.count(b"\n") - len(found)
+        if dropped:
+            self.dropped_lines += dropped
+            self._count_failures(text)
+        batch = {"m": empty_samples(), "a": empty_samples()}
+        if found:
+            found = np.array(found)
+            xyz = found[:, 1:].astype(np.int32)
+            for name, t in _TAGS.items():
+                batch[t] = xyz[found[:, 0] == name]
+                self.telemetry.count_samples(t, batch[t].shape[0])
+        return batch
+
+    def _count_failures(self, text):
+        # only runs for chunks that had a bad line in them, so a python loop is fine here
+        for line in text.split(b"\n")[:-1]:
+            if _SAMPLE_LINE.match(line):
+                continue
+            if line.count(b"[") < 3:
+                self.telemetry.count_failure("garbled")  # transmission error, line garbled
+            elif b" data: " in line:
+                self.telemetry.count_failure("bad_number")  # another screw up: number was empty
+            else:
+                self.telemetry.count_failure("unknown")
+
+    def reset(self):
+        self.rest = b""
+
+
+class TextOrientationReader(_LineChunkReader):
+    """Parses "Got orient:" blocks. feed() returns a (k, 3, 3) array of every orientation completed so far."""
+
+    def __init__(self, telemetry=None):
+        super().__init__(telemetry)
+        # rows of an orientation that hasn't been completed yet
+        self.pending = np.zeros((0, 3))
+
+    def feed(self, data):
+        text = self._complete_lines(data)
+        tokens = _ORIENT_TOKEN.findall(text)
+        dropped = text.count(b"\n") - len(tokens)
+        if dropped:
+            self.dropped_lines += dropped
+            self.telemetry.count_failure("garbled", dropped)
+        if not tokens:
+            return np.zeros((0, 3, 3))
+        tokens = np.array(tokens)
+        is_header = tokens[:, 0] != b""
+        nums = np.zeros((tokens.shape[0], 3))
+        nums[~is_header] = tokens[~is_header, 1:].astype(np.float64)
+
+        # pending rows carry on from before this chunk as if no header came before them
+        nums = np.concatenate((self.pending, nums))
+        is_header = np.concatenate((np.zeros(self.pending.shape[0], dtype=bool), is_header))
+
+        # a header resets the matrix, and every third row after it completes one, like orientation_iter does it
+        idx = np.arange(nums.shape[0])
+        rank = idx - np.maximum.accumulate(np.where(is_header, idx, -1)) - 1
+        ends = np.flatnonzero(~is_header & (rank % 3 == 2))
+        orients = nums[ends[:, np.newaxis] + np.arange(-2, 1)]
+
+        left = (rank[-1] + 1) % 3
+        self.pending = nums[nums.shape[0] - left :] if left else nums[:0]
+        self.telemetry.count_samples("o", orients.shape[0])
+        return orients
+
+    def reset(self):
+        self.rest = b""
+        self.pending = np.zeros((0, 3))
+
+
+class BinarySampleReader(ChunkReader):
+    """Same output as TextSampleReader, for the framed binary protocol in calimu.imu.protocol."""
+
+    def __init__(self, telemetry=None):
+        super().__init__(telemetry)
+        self.decoder = FrameDecoder()
+
+    def feed(self, data):
+        skipped, dropped = self.decoder.skipped_bytes, self.decoder.dropped_frames
+        frames = self.decoder.feed(data)
+        if self.decoder.skipped_bytes != skipped:
+            self.telemetry.count_failure("skipped_bytes", self.decoder.skipped_bytes - skipped)
+        if self.decoder.dropped_frames != dropped:
+            self.telemetry.count_failure("dropped_frames", self.decoder.dropped_frames - dropped)
+        batch = {}
+        for t in _TAGS.values():
+            batch[t] = frames["xyz"][frames["tag"] == ord(t)].astype(np.int32)
+            self.telemetry.count_samples(t, batch[t].shape[0])
+        return batch
+
+    def reset(self):
+        self.decoder.reset()
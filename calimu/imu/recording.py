@@ -0,0 +1,222 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""Record every byte read from an IMU's connection, and replay recordings as if they were the IMU.
+
+A recording is a magic header followed by one record per non-empty read: a little endian uint64 of nanoseconds since
+recording started (monotonic clock), a uint32 length, then the bytes that were read.
+
+ReplaySerial is a pyserial port, so it goes anywhere a connection does: ComImu.connect(ReplaySerial(path)), or
+ComImu.connect("replay://path?speed=4") once this module has been imported, since it registers the replay:// url.
+"""
+
+import struct
+import time
+import urllib.parse
+
+import serial
+from serial.serialutil import PortNotOpenError, SerialBase, SerialException
+
+MAGIC = b"CALIMUR\x01"
+_RECORD = struct.Struct("<QI")
+
+if "calimu.imu.urlhandler" not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append("calimu.imu.urlhandler")
+
+
+def iter_records(path):
+    """Yield (nanoseconds, bytes) of every read in a recording."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} isn't a calimu recording")
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return  # a recording cut off by a crash just ends at its last whole record
+            t, n = _RECORD.unpack(head)
+            data = f.read(n)
+            if len(data) < n:
+                return
+            yield t, data
+
+
+def read_recording(path):
+    """Every byte in a recording, joined, for feeding straight into a reader."""
+    return b"".join(data for _, data in iter_records(path))
+
+
+class RecordingSerial(object):
+    """Wraps a serial connection and appends everything read from it to a recording file.
+
+    Anything that isn't a read goes straight to the wrapped connection. The file is flushed every flush_interval
+    seconds, so a crash loses at most that much.
+    """
+
+    def __init__(self, connection, path, flush_interval=1.0):
+        self.__dict__["connection"] = connection
+        self.__dict__["path"] = path
+        self.__dict__["flush_interval"] = flush_interval
+        self.__dict__["_file"] = open(path, "wb")
+        self._file.write(MAGIC)
+        self.__dict__["_t0"] = time.monotonic_ns()
+        self.__dict__["_last_flush"] = time.monotonic()
+
+    def __getattr__(self, item):
+        return getattr(self.connection, item)
+
+    def __setattr__(self, key, value):
+        # so setting things like timeout on the recording sets them on the port
+        setattr(self.connection, key, value)
+
+    def _record(self, data):
+        if data and not self._file.closed:
+            self._file.write(_RECORD.pack(time.monotonic_ns() - self._t0, len(data)))
+            self._file.write(data)
+            if time.monotonic() - self._last_flush > self.flush_interval:
+                self._file.flush()
+                self.__dict__["_last_flush"] = time.monotonic()
+        return data
+
+    def read(self, size=1):
+        return self._record(self.connection.read(size))
+
+    def readline(self, *args, **kwargs):
+        return self._record(self.connection.readline(*args, **kwargs))
+
+    def stop_recording(self):
+        """Close the recording file and return the wrapped connection."""
+        if not self._file.closed:
+            self._file.close()
+        return self.connection
+
+    def close(self):
+        self.stop_recording()
+        self.connection.close()
+
+
+class ReplaySerial(SerialBase):
+    """A pyserial port that plays back a recording.
+
+    Bytes become readable at the time they were recorded, divided by speed: 1 is real time, 4 is four times as fast,
+    and 0 or None is as fast as whatever reads it. Once the recording runs out, reads act like a silent port and
+    finished turns True. Writes are accepted and thrown away.
+
+    As a url: replay://path/to/recording?speed=4
+    """
+
+    def __init__(self, port=None, speed=1.0, **kwargs):
+        self.speed = speed
+        self._records = None
+        self._next = None
+        self._buffer = bytearray()
+        self._t0 = None
+        super().__init__(port, **kwargs)
+
+    def open(self):
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        path = self._port
+        if path.lower().startswith("replay://"):
+            path, _, query = path[len("replay://") :].partition("?")
+            for option, values in urllib.parse.parse_qs(query).items():
+                if option == "speed":
+                    self.speed = 0 if values[0] in ("max", "0") else float(values[0])
+                else:
+                    raise SerialException(f"unknown replay:// option {option!r}")
+        self._records = iter_records(path)
+        self._next = next(self._records, None)
+        self._buffer = bytearray()
+        self._t0 = None  # the clock starts at the first read, so time spent connecting doesn't skip data
+        self.is_open = True
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self._records.close()
+        super().close()
+
+    def _reconfigure_port(self):
+        pass  # nothing to configure on a recording
+
+    def _update_dtr_state(self):
+        pass
+
+    def _update_rts_state(self):
+        pass
+
+    def _elapsed(self):
+        if self._t0 is None:
+            self._t0 = time.monotonic_ns()
+        if not self.speed:
+            return float("inf")
+        return (time.monotonic_ns() - self._t0) * self.speed
+
+    def _pump(self, want=None):
+        # move every record that's due into the buffer. As fast as possible, records are only pulled in until there's
+        # enough for want, so the chunks still come out like they were read.
+        elapsed = self._elapsed()
+        while self._next is not None and self._next[0] <= elapsed:
+            if not self.speed and self._buffer and (want is None or len(self._buffer) >= want):
+                break
+            self._buffer += self._next[1]
+            self._next = next(self._records, None)
+
+    @property
+    def finished(self):
+        return self._next is None and not self._buffer
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        self._pump()
+        return len(self._buffer)
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise PortNotOpenError()
+        deadline = None if self._timeout is None else time.monotonic() + self._timeout
+        self._pump(size)
+        while len(self._buffer) < size and self._next is not None:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+            wait = (self._next[0] - self._elapsed()) / self.speed / 1e9
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            if wait > 0:
+                time.sleep(wait)
+            self._pump(size)
+        if self._next is None and len(self._buffer) < size and deadline is not None:
+            time.sleep(max(0.0, deadline - time.monotonic()))  # nothing more is coming, like a port that went quiet
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def write(self, data):
+        if not self.is_open:
+            raise PortNotOpenError()
+        return len(data)
+
+    def reset_input_buffer(self):
+        self._buffer.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    @property
+    def cts(self):
+        return True
+
+    @property
+    def dsr(self):
+        return True
+
+    @property
+    def ri(self):
+        return False
+
+    @property
+    def cd(self):
+        return True
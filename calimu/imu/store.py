@@ -1,27 +1,49 @@
 # Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
 
+import os
 import threading
 import time
 from threading import Lock
 
 import numpy as np
 
+from calimu.imu.buffer import BatchHandoff, MappedPointBuffer, PointBuffer
 from calimu.imu.devices.mc6470 import MC6470IMU
 from calimu.imu.util import StoppableThread
+from calimu.pcl_algo.cache import FitCache
+from calimu.pcl_algo.stats import CloudStats
+from calimu.pcl_algo.voxel import VoxelGrid
 import serial
 
 
 class IMUPointStore(StoppableThread):
-    def __init__(self, ardu, colors=None):
+    def __init__(self, ardu, colors=None, dtype=np.int32, min_distance=None, backing_dir=None, flush_interval=1.0):
+        """backing_dir keeps each sensor's points in a memory-mapped file there instead of in RAM, see
+        MappedPointBuffer. Points already in it from an earlier session are loaded back."""
         super().__init__()
 
         self.ardu: MC6470IMU = ardu
 
-        self.points = []
-        self.point_colors = []
+        # gathered batches that haven't been displayed yet
+        self.display_queue = BatchHandoff()
 
-        self.mag_points = []
-        self.acc_points = []
+        # everything gathered, per sensor
+        self.backing_dir = backing_dir
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        if backing_dir is None:
+            self.sensor_points = {"m": PointBuffer(dtype), "a": PointBuffer(dtype)}
+        else:
+            os.makedirs(backing_dir, exist_ok=True)
+            self.sensor_points = {
+                t: MappedPointBuffer(os.path.join(backing_dir, f"{t}.points"), dtype, flush_interval=flush_interval)
+                for t in ("m", "a")
+            }
+        # running stats of everything gathered, so centers and live fits don't need to rescan the points
+        self.stats = {t: self.__load_stats(t) for t in ("m", "a")}
+        # bumped whenever a sensor's points change, so anything computed from them can tell if it's out of date
+        self.data_version = {"m": 0, "a": 0}
+        self.fit_cache = FitCache()
         self.latest_mag = [0, 0, -1]
         self.latest_acc = [0, -1, 0]
 
@@ -36,6 +58,11 @@ class IMUPointStore(StoppableThread):
         self._display_orient_stop = threading.Event()
         self._display_orient_stop.set()
 
+        # voxel grids that gate out points too close to ones already gathered. None when that's off.
+        self.voxels = {"m": None, "a": None}
+        self.rejected_points = {"m": 0, "a": 0}
+        self.set_min_distance(min_distance)
+
         if colors is None:
             self.colors = {
                 "m": [0.8 * 255, 0.8 * 255, 0],
@@ -45,12 +72,92 @@ class IMUPointStore(StoppableThread):
         else:
             self.colors = colors
 
+    def __stats_path(self, t):
+        return os.path.join(self.backing_dir, f"{t}.stats.npz")
+
+    def __load_stats(self, t):
+        pts = self.sensor_points[t]
+        stats = CloudStats()
+        if self.backing_dir is not None and os.path.exists(self.__stats_path(t)):
+            with np.load(self.__stats_path(t)) as arrays:
+                stats = CloudStats.from_arrays(arrays)
+            if stats.count > len(pts):
+                stats = CloudStats()
+        # stats are saved less often than points, so catch up on whatever came in after they were
+        chunk = 1 << 20
+        for i in range(stats.count, len(pts), chunk):
+            stats.update(pts[i : i + chunk])
+        return stats
+
+    def flush(self):
+        """Write the backing files to disk, if there are any."""
+        if self.backing_dir is None:
+            return
+        with self.lock:
+            for t, pts in self.sensor_points.items():
+                pts.flush()
+                tmp = self.__stats_path(t) + ".new"
+                with open(tmp, "wb") as f:
+                    np.savez(f, **self.stats[t].to_arrays())
+                os.replace(tmp, self.__stats_path(t))
+        self._last_flush = time.monotonic()
+
+    @property
+    def mag_points(self):
+        return self.sensor_points["m"]
+
+    @property
+    def acc_points(self):
+        return self.sensor_points["a"]
+
+    def clear_points(self, t):
+        with self.lock:
+            self.sensor_points[t].clear()
+            self.stats[t].reset()
+            if self.voxels[t] is not None:
+                self.voxels[t].clear()
+            self.rejected_points[t] = 0
+            self.__bump_version(t)
+            # batches are put under the same lock, so none from before the clear can be handed over after it
+            self.display_queue.discard(t)
+        self.flush()
+
+    def __bump_version(self, t):
+        self.data_version[t] += 1
+        self.fit_cache.invalidate(t, self.data_version[t])
+
+    def set_min_distance(self, min_distance):
+        """Only keep gathered points that land in a voxel of edge min_distance that doesn't have one yet.
+        None turns that off. Points that were already gathered are kept either way."""
+        with self.lock:
+            for t, pts in self.sensor_points.items():
+                if min_distance is None:
+                    self.voxels[t] = None
+                else:
+                    self.voxels[t] = VoxelGrid(min_distance)
+                    self.voxels[t].insert(pts.view())
+
+    def snapshot(self, t):
+        """A read-only view of a sensor's points, a copy of the stats that match it exactly, and its data version."""
+        with self.lock:
+            return self.sensor_points[t].view(), self.stats[t].copy(), self.data_version[t]
+
+    def colors_for(self, tags):
+        """Get an (n, 3) uint8 color array for an array of uint8 sensor tags (ord("m"), ord("a"), ...)."""
+        table = np.zeros((256, 3), dtype=np.uint8)
+        for t, c in self.colors.items():
+            table[ord(t)] = c
+        return table[tags]
+
     def stop_gathering(self):
         self._gather_stop.set()
 
     def start_gathering(self):
         self._gather_stop.clear()
 
+    def is_gathering(self):
+        return not self._gather_stop.isSet()
+
     def stop_displaying_orient(self):
         self._display_orient_stop.set()
 
@@ -63,31 +170,45 @@ class IMUPointStore(StoppableThread):
         self.stop_gathering()
 
     def __display_orient_loop(self, t0):
-        for t, x, y, z in self.ardu.mag_accel_iter():
-            self.lock.acquire()
-            if t == "m":
-                self.latest_mag = [x, y, z]
-            elif t == "a":
-                self.latest_acc = [x, y, z]
-            self.lock.release()
+        for batch in self.ardu.mag_accel_batch_iter():
+            # replacing the whole list is atomic, so the displayer doesn't need a lock to read these
+            if batch["m"].shape[0]:
+                self.latest_mag = batch["m"][-1].tolist()
+            if batch["a"].shape[0]:
+                self.latest_acc = batch["a"][-1].tolist()
             if time.time() - t0 > 1.0 / self.lock_fps:
                 time.sleep(0)
                 t0 = time.time()
             if self._display_orient_stop.isSet():
                 break
 
+    def add_batch(self, batch):
+        """Add a {"m": (k, 3), "a": (k, 3)} batch of samples, the same way gathering does. For stores fed from
+        somewhere other than their own thread, like MultiIMUReader."""
+        with self.lock:
+            for t, xyz in batch.items():
+                if not xyz.shape[0]:
+                    continue
+                if t == "m":
+                    self.latest_mag = xyz[-1].tolist()
+                elif t == "a":
+                    self.latest_acc = xyz[-1].tolist()
+                if self.voxels[t] is not None:
+                    keep = self.voxels[t].insert(xyz)
+                    self.rejected_points[t] += xyz.shape[0] - int(np.count_nonzero(keep))
+                    xyz = xyz[keep]
+                    if not xyz.shape[0]:
+                        continue
+                self.sensor_points[t].append(xyz)
+                self.stats[t].update(xyz)
+                self.__bump_version(t)
+                self.display_queue.put(t, xyz)
+        if time.monotonic() - self._last_flush > self.flush_interval:
+            self.flush()
+
     def __gather_loop(self, t0):
-        for t, x, y, z in self.ardu.mag_accel_iter():
-            self.lock.acquire()
-            if t == "m":
-                self.mag_points.append([x, y, z])
-                self.latest_mag = [x, y, z]
-            elif t == "a":
-                self.acc_points.append([x, y, z])
-                self.latest_acc = [x, y, z]
-            self.points.append(np.asarray([x, y, z]))
-            self.point_colors.append(self.colors[t])
-            self.lock.release()
+        for batch in self.ardu.mag_accel_batch_iter():
+            self.add_batch(batch)
             if time.time() - t0 > 1.0 / self.lock_fps:
                 time.sleep(0)
                 t0 = time.time()
@@ -116,3 +237,4 @@ class IMUPointStore(StoppableThread):
                 self.__display_orient_loop(t0)
             elif self.ardu.connection is not None and self.ardu.connection.is_open:
                 self.__default_loop()
+        self.flush()
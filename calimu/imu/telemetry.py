@@ -0,0 +1,96 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+import collections
+import threading
+import time
+
+
+class StreamTelemetry(object):
+    """Counters for everything coming in over an IMU connection.
+
+    Readers update this once per chunk rather than once per line, so it's cheap enough to always leave on.
+    Updates and reset() take a lock, so reading or resetting it from another thread (like the GUI) is fine.
+    """
+
+    def __init__(self, rate_window=2.0):
+        self.rate_window = rate_window
+        self.bytes_read = 0
+        self.lines = 0
+        self.samples = collections.Counter()
+        self.parse_failures = collections.Counter()
+        self.connects = 0
+        self._marks = collections.deque()  # (time, samples per sensor) at most every rate_window/16 seconds
+        self._lock = threading.Lock()
+
+    @property
+    def reconnects(self):
+        return max(0, self.connects - 1)
+
+    @property
+    def total_samples(self):
+        return sum(self.samples.values())
+
+    def count_bytes(self, n):
+        with self._lock:
+            self.bytes_read += n
+
+    def count_lines(self, n):
+        with self._lock:
+            self.lines += n
+
+    def count_failure(self, kind, n=1):
+        with self._lock:
+            self.parse_failures[kind] += n
+
+    def count_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def count_samples(self, tag, n):
+        with self._lock:
+            self.samples[tag] += n
+            now = time.monotonic()
+            if not self._marks or now - self._marks[-1][0] >= self.rate_window / 16:
+                self._marks.append((now, dict(self.samples)))
+                while now - self._marks[0][0] > self.rate_window:
+                    self._marks.popleft()
+
+    def samples_per_second(self, tag=None):
+        """Rolling sample rate over the last rate_window seconds, for one sensor or all of them."""
+        with self._lock:
+            marks = list(self._marks)
+        if len(marks) < 2:
+            return 0.0
+        (t0, c0), (t1, c1) = marks[0], marks[-1]
+        if t1 == t0 or time.monotonic() - t1 > self.rate_window:
+            return 0.0  # nothing has come in for a while
+        if tag is None:
+            n = sum(c1.values()) - sum(c0.values())
+        else:
+            n = c1.get(tag, 0) - c0.get(tag, 0)
+        return n / (t1 - t0)
+
+    def snapshot(self):
+        rate = self.samples_per_second()
+        with self._lock:
+            return {
+                "bytes_read": self.bytes_read,
+                "lines": self.lines,
+                "samples": dict(self.samples),
+                "samples_per_second": rate,
+                "parse_failures": dict(self.parse_failures),
+                "reconnects": self.reconnects,
+            }
+
+    def reset(self):
+        """Zero every counter except connects, so reconnects still count across resets."""
+        with self._lock:
+            self.bytes_read = 0
+            self.lines = 0
+            self.samples.clear()
+            self.parse_failures.clear()
+            self._marks.clear()
+
+    def __str__(self):
+        failures = sum(self.parse_failures.values())
+        return f"{self.samples_per_second():.0f} samples/s, {self.total_samples} total, {failures} errors"
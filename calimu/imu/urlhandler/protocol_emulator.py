@@ -0,0 +1,4 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+# pyserial looks up emulator:// urls here, see calimu.imu.devices.emulator
+from calimu.imu.devices.emulator import EmulatorSerial as Serial  # noqa: F401
@@ -0,0 +1,4 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+# pyserial looks up replay:// urls here, see calimu.imu.recording
+from calimu.imu.recording import ReplaySerial as Serial  # noqa: F401
@@ -2,20 +2,190 @@
 
 import time
 
+import vtk
+from vtk.util import numpy_support
 from svtk.vtk_classes.vtk_animation_timer_callback import VTKAnimationTimerCallback
 from svtk.vtk_classes.vtk_displayer import VTKDisplayer
 
+from calimu.imu.buffer import PointBuffer
 from calimu.imu.store import IMUPointStore
 import numpy as np
 
 from calimu.imu.util import normalize
+from calimu.pcl_algo.err import residuals
+from calimu.pcl_algo.voxel import VoxelGrid
+
+
+def residual_lookup_table():
+    """Fixed diverging map for residuals scaled to [-1, 1]: blue inside the fit, white on it, red outside."""
+    # noinspection PyUnresolvedReferences
+    lut = vtk.vtkColorTransferFunction()
+    lut.SetColorSpaceToDiverging()
+    lut.AddRGBPoint(-1.0, 0.230, 0.299, 0.754)
+    lut.AddRGBPoint(0.0, 0.865, 0.865, 0.865)
+    lut.AddRGBPoint(1.0, 0.706, 0.016, 0.150)
+    lut.ClampingOn()
+    return lut
+
+
+class PointCloudActor(object):
+    """A point cloud actor drawn zero-copy out of numpy buffers: append() points, then update() once per frame.
+
+    set_lod() thins which points get drawn, and color_by_residual() colors them by a fit's residuals.
+    """
+
+    def __init__(self, color=(1, 1, 1), point_size=6):
+        self._points = PointBuffer(np.float32)
+        self._ids = np.arange(1024, dtype=np.int64)  # offsets and connectivity of vertex cells, sliced as needed
+        self._drawn = None  # int64 PointBuffer of the point ids with vertices, or None for all of them
+        self.stride = 1
+        self._voxels = None
+        self.lo = np.full(3, np.inf)
+        self.hi = np.full(3, -np.inf)
+        self._dirty = True
+        self._residual_xform = None
+        self._residuals = PointBuffer(np.float32, width=0)
+
+        # noinspection PyUnresolvedReferences
+        self.vtk_points = vtk.vtkPoints()
+        # noinspection PyUnresolvedReferences
+        self.vertices = vtk.vtkCellArray()
+        # noinspection PyUnresolvedReferences
+        self.poly = vtk.vtkPolyData()
+        self.poly.SetPoints(self.vtk_points)
+        self.poly.SetVerts(self.vertices)
+        # noinspection PyUnresolvedReferences
+        self.mapper = vtk.vtkPolyDataMapper()
+        self.mapper.SetInputData(self.poly)
+        # noinspection PyUnresolvedReferences
+        self.actor = vtk.vtkActor()
+        self.actor.SetMapper(self.mapper)
+        self.actor.GetProperty().SetPointSize(point_size)
+        self.actor.GetProperty().SetColor(*color)
+        self.mapper.ScalarVisibilityOff()
+        self.update()
+
+    def __len__(self):
+        return len(self._points)
+
+    @property
+    def drawn_count(self):
+        return len(self) if self._drawn is None else len(self._drawn)
+
+    @property
+    def voxel_size(self):
+        return None if self._voxels is None else self._voxels.min_distance
+
+    def bounds(self):
+        """((xmin, xmax), (ymin, ymax), (zmin, zmax)) of every point, drawn or not."""
+        return tuple(zip(self.lo.tolist(), self.hi.tolist()))
+
+    def __select(self, start, points):
+        # ids of the points from start on that the level of detail draws
+        ids = np.arange(-start % self.stride, points.shape[0], self.stride)
+        if self._voxels is not None:
+            ids = ids[self._voxels.insert(points[ids])]
+        return ids + start
+
+    def append(self, points):
+        """Add (n, 3) points."""
+        points = np.asarray(points)
+        if not points.shape[0]:
+            return
+        start = len(self._points)
+        self._points.append(points)
+        if self._residual_xform is not None:
+            self._residuals.append(residuals(points, self._residual_xform))
+        self.lo = np.minimum(self.lo, points.min(axis=0))
+        self.hi = np.maximum(self.hi, points.max(axis=0))
+        if self._drawn is not None:
+            self._drawn.append(self.__select(start, points))
+        self._dirty = True
+
+    def clear(self):
+        """Drop every point. Doesn't depend on how many there were, since the old buffers are just let go."""
+        self._points.clear()
+        self._residuals.clear()
+        if self._drawn is not None:
+            self._drawn = PointBuffer(np.int64, width=0)
+        if self._voxels is not None:
+            self._voxels = VoxelGrid(self._voxels.min_distance)
+        self.lo = np.full(3, np.inf)
+        self.hi = np.full(3, -np.inf)
+        self._dirty = True
+
+    def set_lod(self, stride=1, voxel_size=None):
+        """Draw every stride-th point, then only one per voxel of edge voxel_size, or all of them with the defaults.
+        Changing it reselects from every point kept."""
+        stride = max(int(stride), 1)
+        if stride == self.stride and voxel_size == self.voxel_size:
+            return
+        self.stride = stride
+        self._voxels = None if voxel_size is None else VoxelGrid(voxel_size)
+        if stride == 1 and voxel_size is None:
+            self._drawn = None
+        else:
+            self._drawn = PointBuffer(np.int64, width=0)
+            chunk = 1 << 20
+            for i in range(0, len(self._points), chunk):
+                self._drawn.append(self.__select(i, self._points[i : i + chunk]))
+        self._dirty = True
+
+    def color_by_residual(self, xform, scale=0.05):
+        """Color points by their signed relative distance from the sphere xform maps them to, with the fixed
+        residual_lookup_table() spanning -scale to scale. None goes back to the actor's color."""
+        self._residual_xform = xform
+        self._residuals = PointBuffer(np.float32, width=0, capacity=max(len(self), 1))
+        if xform is None:
+            self.poly.GetPointData().SetScalars(None)
+            self.mapper.ScalarVisibilityOff()
+        else:
+            # one vectorized pass, in chunks so it doesn't need a float64 copy of the whole cloud
+            chunk = 1 << 20
+            for i in range(0, len(self._points), chunk):
+                self._residuals.append(residuals(self._points[i : i + chunk], xform))
+            self.mapper.SetLookupTable(residual_lookup_table())
+            self.mapper.SetScalarRange(-scale, scale)
+            self.mapper.SetScalarModeToUsePointData()
+            self.mapper.ScalarVisibilityOn()
+        self._dirty = True
+
+    def update(self):
+        """Point vtk at whatever was appended since the last update. Call once a frame, after appending."""
+        if not self._dirty:
+            return
+        n = len(self)
+        if self._ids.shape[0] <= n:
+            self._ids = np.arange(2 * n, dtype=np.int64)
+        connectivity = self._ids[:n] if self._drawn is None else self._drawn.view()
+        m = connectivity.shape[0]
+
+        # deep=False wraps the numpy memory instead of copying it, so this is the same cost for any number of points
+        self.vtk_points.SetData(numpy_support.numpy_to_vtk(self._points.view(), deep=False))
+        if self._residual_xform is not None:
+            self.poly.GetPointData().SetScalars(numpy_support.numpy_to_vtk(self._residuals.view(), deep=False))
+        self.vertices.SetData(
+            numpy_support.numpy_to_vtk(self._ids[: m + 1], deep=False),
+            numpy_support.numpy_to_vtk(connectivity, deep=False),
+        )
+        self.poly.Modified()
+        self._dirty = False
 
 
 class _VTKIMUPointDisplayer(VTKAnimationTimerCallback):
-    def __init__(self, point_store: IMUPointStore):
+    def __init__(self, point_store: IMUPointStore, camera_fps=4):
         super().__init__()
         self.point_store = point_store
         self.__is_first_loop = True
+        # more stores can be drawn along with the main one, like every device of a MultiIMUReader. By name.
+        self.stores = {None: point_store}
+        # gathered points, one actor per (store name, sensor). svtk's own points are only the compass.
+        self.clouds: dict = {}
+        self.lod = (1, None)
+        # refitting the camera every frame makes it jitter and isn't needed for a cloud that grows slowly
+        self.camera_fps = camera_fps
+        self._t_camera = 0
+        self._camera_bounds = None
 
     def first_loop(self):
         self.add_points(
@@ -28,39 +198,92 @@ class _VTKIMUPointDisplayer(VTKAnimationTimerCallback):
             [[0.4 * 255, 0.4 * 255, 0], [0.5 * 255, 0, 0], [0.6 * 255, 0.2 * 255, 0]]
         )
 
+    def cloud(self, name, t):
+        """The actor of a store's sensor, made the first time it has points."""
+        cloud = self.clouds.get((name, t))
+        if cloud is None:
+            cloud = PointCloudActor([c / 255.0 for c in self.stores[name].colors[t]])
+            cloud.set_lod(*self.lod)
+            self.clouds[(name, t)] = cloud
+            self.renderer.AddActor(cloud.actor)
+        return cloud
+
+    def remove_store(self, name):
+        del self.stores[name]
+        for key in [k for k in self.clouds if k[0] == name]:
+            self.renderer.RemoveActor(self.clouds.pop(key).actor)
+
+    def fit_cloud_in_cam(self):
+        clouds = [c for c in self.clouds.values() if len(c)]
+        if clouds:
+            lo = np.min([c.lo for c in clouds], axis=0)
+            hi = np.max([c.hi for c in clouds], axis=0)
+            bounds = tuple(zip(lo.tolist(), hi.tolist()))
+            if bounds != self._camera_bounds:
+                self.interactor_style.camera_for_bounds(bounds)
+                self._camera_bounds = bounds
+        self._t_camera = time.time()
+
     def loop(self, obj, event):
         if self.__is_first_loop:
             self.first_loop()
             self.__is_first_loop = False
 
-        if not self.point_store.lock.locked():
-            self.point_store.lock.acquire()
-            super(_VTKIMUPointDisplayer, self).loop(obj, event)
-            if len(self.point_store.points) and len(
-                    self.point_store.point_colors
-            ) == len(self.point_store.points):
-                self.add_points(
-                    self.point_store.points,
-                    self.point_store.point_colors,
-                )
+        super(_VTKIMUPointDisplayer, self).loop(obj, event)
+
+        # everything gathered since the last frame, in one go
+        for name, store in list(self.stores.items()):
+            for t, points in store.display_queue.swap():
+                self.cloud(name, t).append(points)
+        for cloud in self.clouds.values():
+            cloud.update()
+        if time.time() - self._t_camera > 1.0 / self.camera_fps:
+            self.fit_cloud_in_cam()
+
+        elen = np.linalg.norm(self.point_store.latest_mag)
+        east = np.cross(normalize(self.point_store.latest_mag), -normalize(self.point_store.latest_acc))
+        east = east * elen
+        self.position_points(
+            [self.point_store.latest_mag, self.point_store.latest_acc, east],
+            [1, 2, 3]
+        )
+
+        time.sleep(0)
 
 
+def make_voxel_actor(centers, size, color):
+    """Wireframe cubes of edge size at every center, e.g. from VoxelGrid.cells()."""
+    # noinspection PyUnresolvedReferences
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(np.asarray(centers, dtype=np.float32), deep=True))
+    # noinspection PyUnresolvedReferences
+    poly = vtk.vtkPolyData()
+    poly.SetPoints(points)
 
-                self.fit_points_in_cam()
-                self.point_store.points.clear()
-                self.point_store.point_colors.clear()
+    # noinspection PyUnresolvedReferences
+    cube = vtk.vtkCubeSource()
+    cube.SetXLength(size)
+    cube.SetYLength(size)
+    cube.SetZLength(size)
 
-            elen = np.linalg.norm(self.point_store.latest_mag)
-            east = np.cross(normalize(self.point_store.latest_mag), -normalize(self.point_store.latest_acc))
-            east = east * elen
-            self.position_points(
-                [self.point_store.latest_mag, self.point_store.latest_acc, east],
-                [1, 2, 3]
-            )
+    # noinspection PyUnresolvedReferences
+    glyphs = vtk.vtkGlyph3D()
+    glyphs.SetSourceConnection(cube.GetOutputPort())
+    glyphs.SetInputData(poly)
+    glyphs.ScalingOff()
+    glyphs.Update()
 
-            self.point_store.lock.release()
+    # noinspection PyUnresolvedReferences
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputConnection(glyphs.GetOutputPort())
+    mapper.ScalarVisibilityOff()
 
-            time.sleep(0)
+    # noinspection PyUnresolvedReferences
+    actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+    actor.GetProperty().SetRepresentationToWireframe()
+    actor.GetProperty().SetColor(*color)
+    return actor
 
 
 class IMUPointDisplayer(object):
@@ -70,5 +293,40 @@ class IMUPointDisplayer(object):
         self.point_store = point_store
         self.displayer = VTKDisplayer(_VTKIMUPointDisplayer, self.point_store)
 
+    @property
+    def clouds(self):
+        """{(store name, sensor): PointCloudActor}. The main store's name is None."""
+        return self.displayer.callback_instance.clouds
+
+    def add_store(self, name, store: IMUPointStore):
+        """Draw another store's points too, in its own colors."""
+        self.displayer.callback_instance.stores[name] = store
+
+    def remove_store(self, name):
+        self.displayer.callback_instance.remove_store(name)
+
+    def clear_points(self, t, name=None):
+        """Delete a sensor's points from its store and from the view."""
+        # the store also drops the batches it hasn't handed over yet, so nothing from before this shows up after it
+        self.displayer.callback_instance.stores[name].clear_points(t)
+        cloud = self.clouds.get((name, t))
+        if cloud is not None:
+            cloud.clear()
+
+    def color_by_residual(self, t, xform, name=None, scale=0.05):
+        """Color a sensor's points by their residuals against a fit's xform, or by the sensor's color again if
+        xform is None. See PointCloudActor.color_by_residual."""
+        callback = self.displayer.callback_instance
+        if xform is None and (name, t) not in callback.clouds:
+            return
+        callback.cloud(name, t).color_by_residual(xform, scale)
+
+    def set_lod(self, stride=1, voxel_size=None):
+        """Only draw a subset of the gathered points, see PointCloudActor.set_lod. The stores keep all of them."""
+        callback = self.displayer.callback_instance
+        callback.lod = (stride, voxel_size)
+        for cloud in callback.clouds.values():
+            cloud.set_lod(stride, voxel_size)
+
     def run_once(self) -> None:
         self.displayer.process_events()
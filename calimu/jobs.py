@@ -0,0 +1,77 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+import concurrent.futures
+import traceback
+
+
+class _Job(object):
+    def __init__(self, future, on_done, on_error, key):
+        self.future = future
+        self.on_done = on_done
+        self.on_error = on_error
+        self.key = key
+        self.stale = False
+
+
+class JobRunner(object):
+    """Runs slow work like fits and error evaluation on a thread pool, so the Tk and render loops keep going.
+
+    Callbacks don't run on the worker threads: poll() runs them for every finished job, and the GUI calls it from its
+    loop, so callbacks can touch widgets. A job can be given a key, and submitting another job with the same key makes
+    the old one stale: it's cancelled if it hasn't started, and its result is thrown away if it has.
+    """
+
+    def __init__(self, workers=2):
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self._jobs = []
+        self._keyed = {}
+
+    def submit(self, fn, *args, key=None, on_done=None, on_error=None, **kwargs):
+        if key is not None:
+            self.cancel(key)
+        job = _Job(self._pool.submit(fn, *args, **kwargs), on_done, on_error, key)
+        self._jobs.append(job)
+        if key is not None:
+            self._keyed[key] = job
+        return job.future
+
+    def cancel(self, key):
+        job = self._keyed.pop(key, None)
+        if job is not None:
+            job.stale = True
+            job.future.cancel()
+
+    def pending(self):
+        """Number of jobs whose results are still wanted."""
+        return sum(1 for j in self._jobs if not j.stale)
+
+    def busy(self):
+        return self.pending() > 0
+
+    def poll(self):
+        """Run the callbacks of every finished job. Call this from the thread that owns the widgets."""
+        done = [j for j in self._jobs if j.future.done()]
+        if not done:
+            return
+        self._jobs = [j for j in self._jobs if not j.future.done()]
+        for job in done:
+            if self._keyed.get(job.key) is job:
+                del self._keyed[job.key]
+            if job.stale or job.future.cancelled():
+                continue
+            e = job.future.exception()
+            if e is None:
+                if job.on_done is not None:
+                    job.on_done(job.future.result())
+            elif job.on_error is not None:
+                job.on_error(e)
+            else:
+                traceback.print_exception(type(e), e, e.__traceback__)
+
+    def shutdown(self):
+        for job in self._jobs:
+            job.stale = True
+            job.future.cancel()
+        self._jobs = []
+        self._keyed = {}
+        self._pool.shutdown(wait=False)
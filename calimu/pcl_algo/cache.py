@@ -0,0 +1,67 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+import collections
+import threading
+
+
+class FitCache(object):
+    """Bounded LRU cache of fits and their error metrics, keyed on (sensor, data version, center, fit).
+
+    The data version changes whenever a sensor's points do, so entries of older versions can never be hit again.
+    invalidate() drops them right away instead of waiting for them to get pushed out.
+    Every method takes a lock, since fits finish on worker threads while points come in on the gathering one.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()  # key: [FitResult or None, (rel_std, mae) or None]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key, i):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[i] is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[i]
+
+    def _put(self, key, i, value):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [None, None]
+            entry[i] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_fit(self, key):
+        """The FitResult stored for key, or None."""
+        return self._get(key, 0)
+
+    def put_fit(self, key, result):
+        self._put(key, 0, result)
+
+    def get_err(self, key):
+        """The (rel_std, mae) stored for key, or None."""
+        return self._get(key, 1)
+
+    def put_err(self, key, err):
+        self._put(key, 1, err)
+
+    def invalidate(self, sensor, version=None):
+        """Drop every entry of a sensor that isn't for version. None drops all of them."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == sensor and k[1] != version]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
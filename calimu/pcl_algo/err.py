@@ -3,25 +3,80 @@
 import numpy as np
 
 
-def get_err(cloud, xform):
-    # transform the points in the cloud to a sphere of size 1 using xform and check how close we got
+def _rel_dist_chunks(cloud, xform, chunk_size=65536, dtype=np.float64):
+    # yields the relative distance of each chunk of points from the unit sphere, computed into buffers that get reused
+    # for every chunk, so only use each one before asking for the next
     xform_inv = np.linalg.inv(xform)
+    a = np.ascontiguousarray(xform_inv[:3, :3].T, dtype=dtype)
+    t = xform_inv[:3, 3].astype(dtype)
+
+    pts = np.empty((chunk_size, 3), dtype=dtype)
+    c = np.empty((chunk_size, 3), dtype=dtype)
+    r = np.empty(chunk_size, dtype=dtype)
+    rel_dist = np.empty(chunk_size, dtype=dtype)
+    inside = np.empty(chunk_size, dtype=bool)
+
+    for i in range(0, cloud.shape[0], chunk_size):
+        chunk = cloud[i : i + chunk_size]
+        n = chunk.shape[0]
+        np.copyto(pts[:n], chunk, casting="unsafe")
+        np.matmul(pts[:n], a, out=c[:n])
+        c[:n] += t
+        np.einsum("ij,ij->i", c[:n], c[:n], out=r[:n])
+        np.sqrt(r[:n], out=r[:n])
+
+        # fix for transforms that shrink the data to zero:
+        # if the cloud goes to 0, the max err/dist is just 1
+        # however, if the cloud goes to inf, the max err/dist is inf
+        # here, we fix that so that it goes to inf in either direction
+        np.subtract(r[:n], 1, out=rel_dist[:n])
+        np.less(r[:n], 1, out=inside[:n])
+        np.reciprocal(r[:n], out=r[:n], where=inside[:n])
+        np.subtract(1, r[:n], out=rel_dist[:n], where=inside[:n])
+        yield rel_dist[:n]
+
+
+def residuals(cloud, xform, chunk_size=65536, dtype=np.float32):
+    """Signed relative distance of every point from the unit sphere that xform maps the cloud to, the same distances
+    get_err summarizes. Positive outside the sphere, negative inside."""
     cloud = np.asarray(cloud)
-    b = np.ones((cloud.shape[0], cloud.shape[1] + 1))
-    b[:, :-1] = cloud
-    c = np.dot(b, xform_inv.T)
-    c2 = c[:, :-1]
-    r = np.linalg.norm(c2, axis=1)
-
-    # fix for transforms that shrink the data to zero:
-    # if the cloud goes to 0, the max err/dist is just 1
-    # however, if the cloud goes to inf, the max err/dist is inf
-    # here, we fix that so that it goes to inf in either direction
-    rel_dist = r - np.ones_like(r)
-    rel_dist[rel_dist < 0] = -1 / (rel_dist[rel_dist < 0] + 1) + 1
-
-    rel_std = np.std(
-        rel_dist + 1
-    )  # avg is one, so this is already relative standard deviation
-    mae = np.sum(np.sum(np.abs(rel_dist))) / r.shape[0]
+    out = np.empty(cloud.shape[0], dtype=dtype)
+    i = 0
+    for rel_dist in _rel_dist_chunks(cloud, xform, chunk_size, dtype):
+        out[i : i + rel_dist.shape[0]] = rel_dist
+        i += rel_dist.shape[0]
+    return out
+
+
+def get_err(cloud, xform, chunk_size=65536, dtype=np.float64):
+    """Transform the points in the cloud to a sphere of size 1 using xform and check how close we got.
+
+    Returns the relative standard deviation and mean absolute error of the distances from the sphere. The cloud is
+    streamed through in chunks of chunk_size points, with running sums combined like Chan et al.'s parallel variance,
+    so memory use doesn't grow with the cloud. dtype=np.float32 halves the work per chunk, the sums stay float64.
+    """
+    cloud = np.asarray(cloud)
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    abs_sum = 0.0
+    scratch = np.empty(chunk_size, dtype=dtype)
+    for rel_dist in _rel_dist_chunks(cloud, xform, chunk_size, dtype):
+        n = rel_dist.shape[0]
+        chunk_mean = float(np.sum(rel_dist, dtype=np.float64)) / n
+        d = np.subtract(rel_dist, chunk_mean, out=scratch[:n])
+        chunk_m2 = float(np.dot(d, d))
+        abs_sum += float(np.sum(np.abs(rel_dist, out=scratch[:n]), dtype=np.float64))
+
+        delta = chunk_mean - mean
+        total = count + n
+        mean += delta * n / total
+        m2 += chunk_m2 + delta * delta * count * n / total
+        count = total
+
+    if count == 0:
+        return np.nan, np.nan
+    # avg is one, so this is already relative standard deviation
+    rel_std = np.sqrt(m2 / count)
+    mae = abs_sum / count
     return rel_std, mae
@@ -1,9 +1,7 @@
 # Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
 
 import numpy as np
-import sklearn
 from numpy.linalg import eig, inv
-import sklearn.decomposition
 
 
 def from_axis_aligned_bounding_box(cloud, center):
@@ -44,34 +42,44 @@ def from_sphere(cloud, center):
     return t2, r_avg
 
 
-def from_pca(cloud, center):
-    cloud = np.asarray(cloud)
-    cl = cloud.copy()
+def _principal_components(cloud):
+    # same as sklearn's PCA(n_components=3) components_ and explained_variance_, from the 3×3 covariance instead of
+    # an svd of the whole cloud, which is also what sklearn itself does for clouds much taller than they are wide
+    cl = cloud - np.mean(cloud, axis=0)
+    cov = (cl.T @ cl) / max(cloud.shape[0] - 1, 1)
+    variance, vectors = np.linalg.eigh(cov)
+    order = np.argsort(variance)[::-1]
+    variance = np.maximum(variance[order], 0)
+    components = vectors[:, order].T
 
-    cl[:, 0:3] = cl[:, 0:3] - center[0:3]
+    # sklearn's sign convention: the largest entry of each component is positive
+    biggest = np.argmax(np.abs(components), axis=1)
+    components *= np.sign(components[np.arange(3), biggest])[:, np.newaxis]
+    return components, variance
 
-    # noinspection PyUnresolvedReferences
-    pca = sklearn.decomposition.PCA(n_components=3)
-    _ = pca.fit_transform(cl)
+
+def from_pca(cloud, center):
+    cloud = np.asarray(cloud, dtype=np.float64)
+    components, variance = _principal_components(cloud)
 
     t0 = np.eye(4)
     t0[0:3, 3] = center[0:3]
 
     t1 = np.eye(4)
-    t1[0, 0:3] = pca.components_[0]
-    t1[1, 0:3] = pca.components_[1]
-    t1[2, 0:3] = pca.components_[2]
+    t1[0, 0:3] = components[0]
+    t1[1, 0:3] = components[1]
+    t1[2, 0:3] = components[2]
 
-    scale_vec = np.sqrt(pca.explained_variance_) * 2
+    scale_vec = np.sqrt(variance) * 2
     t2 = np.eye(4)
     t2[0, 0] = scale_vec[0]
     t2[1, 1] = scale_vec[1]
     t2[2, 2] = scale_vec[2]
 
     t3 = np.eye(4)
-    t3[0, 0:3] = pca.components_[0]
-    t3[1, 0:3] = pca.components_[1]
-    t3[2, 0:3] = pca.components_[2]
+    t3[0, 0:3] = components[0]
+    t3[1, 0:3] = components[1]
+    t3[2, 0:3] = components[2]
     t3 = np.linalg.inv(t3)
 
     t4 = t0 @ t1 @ t2 @ t3
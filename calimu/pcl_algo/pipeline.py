@@ -0,0 +1,111 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""Center + fit combinations by name, so they can run anywhere: the GUI, a worker thread, or a script."""
+
+import collections
+
+import calimu.pcl_algo.center
+import calimu.pcl_algo.fit
+import calimu.pcl_algo.robust
+import calimu.pcl_algo.util
+from calimu.pcl_algo.stats import CloudStats
+
+# name: description shown in the GUI
+CENTER_METHODS = collections.OrderedDict(
+    [
+        ("zero", "Zero"),
+        ("bounds", "Bounds"),
+        ("average", "Avg"),
+        ("sphere", "Sphere"),
+        ("ellipsoid", "Ellipsoid"),
+        ("ransac", "RANSAC"),
+        ("irls", "IRLS"),
+    ]
+)
+FIT_METHODS = collections.OrderedDict(
+    [
+        ("aabb", "AABB"),
+        ("pca", "PCA"),
+        ("sphere", "Sphere"),
+        ("ellipsoid", "Ellipsoid"),
+        ("ransac", "RANSAC"),
+        ("irls", "IRLS"),
+    ]
+)
+
+FitResult = collections.namedtuple(
+    "FitResult", ["center_method", "fit_method", "center", "xform", "avg_scale"]
+)
+
+
+class EllipsoidPolys(object):
+    """Computes each kind of ellipsoid polynomial at most once, so centers and fits that share one don't redo it."""
+
+    def __init__(self, cloud, stats=None, processes=None, polys=None):
+        self.cloud = cloud
+        self.stats = stats
+        self.processes = processes
+        self._polys = dict(polys) if polys else {}  # any that were already computed somewhere else
+
+    def get(self, kind):
+        if kind not in self._polys:
+            if kind == "ellipsoid":
+                if self.stats is not None:
+                    poly = self.stats.ellipsoid_poly()
+                else:
+                    poly = calimu.pcl_algo.util.ls_ellipsoid(self.cloud).ravel()
+            elif kind == "ransac":
+                poly = calimu.pcl_algo.robust.ransac_ellipsoid(
+                    self.cloud, processes=self.processes
+                )
+            elif kind == "irls":
+                # tukey throws outliers away completely, so it needs a decent start
+                poly = calimu.pcl_algo.robust.irls_ellipsoid(
+                    self.cloud, "tukey", poly=self.get("ransac")
+                )
+            else:
+                raise NotImplementedError("Unknown ellipsoid fit")
+            self._polys[kind] = poly
+        return self._polys[kind]
+
+
+def get_center(method, cloud, stats, polys):
+    if method == "zero":
+        return calimu.pcl_algo.center.by_zero(None)
+    elif method == "bounds":
+        return stats.by_bounds()
+    elif method == "average":
+        return stats.by_average()
+    elif method == "sphere":
+        return stats.by_sphere_fit()
+    elif method in ("ellipsoid", "ransac", "irls"):
+        return calimu.pcl_algo.center.by_ellipsoid_fit(polys.get(method))
+    raise NotImplementedError("Unknown center method")
+
+
+def get_fit(method, cloud, center, polys):
+    if method == "aabb":
+        return calimu.pcl_algo.fit.from_axis_aligned_bounding_box(cloud, center)
+    elif method == "pca":
+        return calimu.pcl_algo.fit.from_pca(cloud, center)
+    elif method == "sphere":
+        return calimu.pcl_algo.fit.from_sphere(cloud, center)
+    elif method in ("ellipsoid", "ransac", "irls"):
+        return calimu.pcl_algo.fit.from_ellipsoid(center, polys.get(method))
+    raise NotImplementedError("Unknown fit method")
+
+
+def run_fit(cloud, center_method, fit_method, stats=None, processes=None, polys=None):
+    """Center and fit a cloud, like the GUI's Add button. Returns a FitResult.
+
+    stats are the cloud's CloudStats if they're already around; otherwise they're computed here.
+    polys can be an EllipsoidPolys shared between several calls on the same cloud.
+    """
+    if stats is None:
+        stats = CloudStats()
+        stats.update(cloud)
+    if polys is None:
+        polys = EllipsoidPolys(cloud, stats, processes)
+    center = get_center(center_method, cloud, stats, polys)
+    xform, avg_scale = get_fit(fit_method, cloud, center, polys)
+    return FitResult(center_method, fit_method, center, xform, avg_scale)
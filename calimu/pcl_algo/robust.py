@@ -0,0 +1,166 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""Outlier resistant versions of ls_ellipsoid, for clouds with serial glitches or magnetic disturbances in them.
+
+Both return the same 10 coefficient polynomial as ls_ellipsoid, so they plug into by_ellipsoid_fit/from_ellipsoid.
+Residuals here are algebraic: Ax^2 + ... + Iz - 1, which near the surface is about twice the relative radial distance.
+"""
+
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from calimu.pcl_algo.util import ellipsoid_design_matrix, ls_ellipsoid, process_pool
+
+_MINIMAL_SAMPLE = 9  # 9 unknowns in Ax^2 + By^2 + Cz^2 + Dxy + Exz + Fyz + Gx + Hy + Iz = 1
+
+
+def _score_hypotheses(j, polys, threshold, chunk=64):
+    # inlier count of every hypothesis against every point, chunk hypotheses at a time to bound memory
+    scores = np.empty(polys.shape[0], dtype=np.int64)
+    for i in range(0, polys.shape[0], chunk):
+        r = np.abs(j @ polys[i : i + chunk].T - 1)
+        scores[i : i + chunk] = np.count_nonzero(r < threshold, axis=0)
+    return scores
+
+
+def _score_shared(name, shape, polys, threshold, chunk=1 << 16):
+    # worker side: score against the cloud in shared memory, building the design matrix a chunk of points at a time
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        cloud = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        scores = np.zeros(polys.shape[0], dtype=np.int64)
+        for i in range(0, shape[0], chunk):
+            scores += _score_hypotheses(ellipsoid_design_matrix(cloud[i : i + chunk]), polys, threshold)
+        del cloud  # the buffer can't close while an array still points into it
+        return scores
+    finally:
+        shm.close()
+
+
+# kept between calls, since spawning the workers costs more than scoring most clouds
+_pool = None
+_pool_processes = None
+_pool_lock = threading.Lock()
+
+
+def _scoring_pool(processes):
+    global _pool, _pool_processes
+    with _pool_lock:
+        if _pool is None or _pool_processes != processes:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = process_pool(processes)
+            _pool_processes = processes
+        return _pool
+
+
+def _is_ellipsoid(polys):
+    # the quadratic part has to be positive definite, or it's a hyperboloid/cylinder/etc.
+    a3 = np.empty((polys.shape[0], 3, 3))
+    a3[:, 0, 0] = 2 * polys[:, 0]
+    a3[:, 1, 1] = 2 * polys[:, 1]
+    a3[:, 2, 2] = 2 * polys[:, 2]
+    a3[:, 0, 1] = a3[:, 1, 0] = polys[:, 3]
+    a3[:, 0, 2] = a3[:, 2, 0] = polys[:, 4]
+    a3[:, 1, 2] = a3[:, 2, 1] = polys[:, 5]
+    return np.all(np.linalg.eigvalsh(a3) > 0, axis=1)
+
+
+def ransac_ellipsoid(cloud, hypotheses=512, threshold=0.1, processes=None, seed=None):
+    """RANSAC ellipsoid fit.
+
+    Fits every minimal 9 point hypothesis in one batched solve, scores all of them against the whole cloud with
+    matrix products, optionally split across a process pool, then refits ls_ellipsoid on the best one's inliers.
+
+    Args:
+        cloud: (N, 3) points
+        hypotheses: number of random minimal samples to try
+        threshold: max algebraic residual for a point to count as an inlier
+        processes: size of the process pool to score hypotheses with. None or 1 scores them in this process.
+        seed: seed for picking the samples
+    """
+    cloud = np.asarray(cloud, dtype=np.float64)
+    if cloud.shape[0] < _MINIMAL_SAMPLE:
+        raise ValueError(f"need at least {_MINIMAL_SAMPLE} points to fit an ellipsoid")
+    j = ellipsoid_design_matrix(cloud)
+
+    # scale the columns to 1 so the minimal solves are well conditioned, then scale the solutions back
+    d = np.sqrt(np.mean(j * j, axis=0))
+    d[d == 0] = 1
+    rng = np.random.default_rng(seed)
+    idx = np.stack([rng.choice(cloud.shape[0], _MINIMAL_SAMPLE, replace=False) for _ in range(hypotheses)])
+    a = j[idx] / d
+    # pinv rather than solve, so degenerate samples just make bad hypotheses instead of raising
+    polys = (np.linalg.pinv(a) @ np.ones((hypotheses, _MINIMAL_SAMPLE, 1)))[:, :, 0] / d
+
+    if processes is None or processes <= 1:
+        scores = _score_hypotheses(j, polys, threshold)
+    else:
+        # the workers get the cloud once through shared memory, rather than the 3x bigger j with every part
+        shm = shared_memory.SharedMemory(create=True, size=cloud.nbytes)
+        try:
+            np.ndarray(cloud.shape, dtype=np.float64, buffer=shm.buf)[:] = cloud
+            pool = _scoring_pool(processes)
+            parts = np.array_split(polys, processes)
+            futures = [pool.submit(_score_shared, shm.name, cloud.shape, p, threshold) for p in parts]
+            scores = np.concatenate([f.result() for f in futures])
+        finally:
+            shm.close()
+            shm.unlink()
+    scores[~_is_ellipsoid(polys)] = -1
+
+    best = polys[np.argmax(scores)]
+    inliers = np.abs(j @ best - 1) < threshold
+    if np.count_nonzero(inliers) < _MINIMAL_SAMPLE:
+        return ls_ellipsoid(cloud).ravel()
+    return ls_ellipsoid(cloud[inliers]).ravel()
+
+
+def _huber_weights(u, k=1.345):
+    a = np.abs(u)
+    w = np.ones_like(a)
+    w[a > k] = k / a[a > k]
+    return w
+
+
+def _tukey_weights(u, k=4.685):
+    w = (1 - (u / k) ** 2) ** 2
+    w[np.abs(u) >= k] = 0
+    return w
+
+
+_WEIGHTS = {"huber": _huber_weights, "tukey": _tukey_weights}
+
+
+def irls_ellipsoid(cloud, loss="huber", iterations=30, tol=1e-10, poly=None):
+    """Iteratively reweighted least squares ellipsoid fit with Huber or Tukey weights.
+
+    Starts from poly (or ls_ellipsoid) and reweights by the residuals, scaled by their median absolute deviation.
+    Tukey throws far outliers away completely, so it's better after a decent start, like a RANSAC poly.
+    """
+    if loss not in _WEIGHTS:
+        raise ValueError(f"loss should be one of {list(_WEIGHTS)}")
+    j = ellipsoid_design_matrix(cloud)
+    d = np.sqrt(np.mean(j * j, axis=0))
+    d[d == 0] = 1
+    js = j / d
+
+    if poly is None:
+        poly = ls_ellipsoid(cloud).ravel()
+    p = np.asarray(poly, dtype=np.float64).ravel()[:9]
+    for _ in range(iterations):
+        r = j @ p - 1
+        scale = 1.4826 * np.median(np.abs(r - np.median(r)))
+        if scale == 0:
+            break
+        w = _WEIGHTS[loss](r / scale)
+        # weighted normal equations, so each iteration is one pass over the points and a 9×9 solve
+        jtw = js.T * w
+        new_p = np.linalg.lstsq(jtw @ js, jtw.sum(axis=1), rcond=None)[0] / d
+        converged = np.max(np.abs(new_p - p)) <= tol * np.max(np.abs(p))
+        p = new_p
+        if converged:
+            break
+    return np.append(p, -1)
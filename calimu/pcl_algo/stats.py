@@ -0,0 +1,96 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+import copy
+
+import numpy as np
+
+import calimu.pcl_algo.center
+from calimu.pcl_algo.util import IncrementalEllipsoid, scaled_lstsq
+
+
+class CloudStats(object):
+    """Sufficient statistics of a point cloud, fed batch by batch as points come in.
+
+    Tracks min/max, sums, the 4×4 moment sums by_sphere_fit needs and the 9×9 ones ls_ellipsoid needs, so every
+    calimu.pcl_algo.center estimate can be read off in O(1) no matter how big the cloud is.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.min = np.full(3, np.inf)
+        self.max = np.full(3, -np.inf)
+        self.sum = np.zeros(3)
+        self.sphere_ata = np.zeros((4, 4))
+        self.sphere_atf = np.zeros(4)
+        self.ellipsoid = IncrementalEllipsoid()
+
+    def reset(self):
+        self.__init__()
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    def to_arrays(self):
+        """Everything needed to rebuild these stats, as a dict of arrays for np.savez."""
+        return {
+            "count": np.array(self.count),
+            "min": self.min,
+            "max": self.max,
+            "sum": self.sum,
+            "sphere_ata": self.sphere_ata,
+            "sphere_atf": self.sphere_atf,
+            "ellipsoid_jtj": self.ellipsoid.jtj,
+            "ellipsoid_jt1": self.ellipsoid.jt1,
+            "ellipsoid_count": np.array(self.ellipsoid.count),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        stats = cls()
+        stats.count = int(arrays["count"])
+        stats.min = np.array(arrays["min"], dtype=np.float64)
+        stats.max = np.array(arrays["max"], dtype=np.float64)
+        stats.sum = np.array(arrays["sum"], dtype=np.float64)
+        stats.sphere_ata = np.array(arrays["sphere_ata"], dtype=np.float64)
+        stats.sphere_atf = np.array(arrays["sphere_atf"], dtype=np.float64)
+        stats.ellipsoid.jtj = np.array(arrays["ellipsoid_jtj"], dtype=np.float64)
+        stats.ellipsoid.jt1 = np.array(arrays["ellipsoid_jt1"], dtype=np.float64)
+        stats.ellipsoid.count = int(arrays["ellipsoid_count"])
+        return stats
+
+    def update(self, cloud):
+        cloud = np.asarray(cloud, dtype=np.float64)
+        if cloud.shape[0] == 0:
+            return
+        self.count += cloud.shape[0]
+        np.minimum(self.min, cloud.min(axis=0), out=self.min)
+        np.maximum(self.max, cloud.max(axis=0), out=self.max)
+        self.sum += cloud.sum(axis=0)
+
+        a = np.ones((cloud.shape[0], 4))
+        a[:, 0:3] = cloud
+        f = np.sum(cloud * cloud, axis=1)
+        self.sphere_ata += a.T @ a
+        self.sphere_atf += a.T @ f
+
+        self.ellipsoid.update(cloud)
+
+    def by_bounds(self):
+        return tuple((self.max + self.min) / 2)
+
+    def by_average(self):
+        return tuple(self.sum / self.count)
+
+    def by_sphere_fit(self):
+        sol = scaled_lstsq(self.sphere_ata, self.sphere_atf)
+        return sol[0] / 2.0, sol[1] / 2.0, sol[2] / 2.0
+
+    def ellipsoid_poly(self):
+        return self.ellipsoid.solve()
+
+    def by_ellipsoid_fit(self):
+        return calimu.pcl_algo.center.by_ellipsoid_fit(self.ellipsoid_poly())
+
+    def half_extents(self):
+        """Half the size of the bounding box, like from_axis_aligned_bounding_box uses."""
+        return (self.max - self.min) / 2
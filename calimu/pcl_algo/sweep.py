@@ -0,0 +1,129 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""Fit all: every center × fit combination at once, ranked by how well each one turns the cloud into a unit sphere."""
+
+import collections
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import calimu.pcl_algo.err
+import calimu.pcl_algo.robust
+from calimu.pcl_algo.pipeline import CENTER_METHODS, FIT_METHODS, EllipsoidPolys, run_fit
+from calimu.pcl_algo.stats import CloudStats
+from calimu.pcl_algo.util import process_pool
+
+SweepResult = collections.namedtuple(
+    "SweepResult",
+    ["center_method", "fit_method", "center", "xform", "avg_scale", "rel_std", "mae"],
+)
+
+_ROBUST = ("ransac", "irls")
+
+# the cloud, as seen from inside a worker process
+_worker_shm = None
+_worker_cloud = None
+
+
+def _init_worker(name, shape, dtype):
+    global _worker_shm, _worker_cloud
+    _worker_shm = shared_memory.SharedMemory(name=name)
+    _worker_cloud = np.ndarray(shape, dtype=dtype, buffer=_worker_shm.buf)
+    _worker_cloud.flags.writeable = False
+
+
+def _robust_poly(kind, start=None):
+    if kind == "ransac":
+        return calimu.pcl_algo.robust.ransac_ellipsoid(_worker_cloud)
+    return calimu.pcl_algo.robust.irls_ellipsoid(_worker_cloud, "tukey", poly=start)
+
+
+def _run_combo(center_method, fit_method, stats, polys):
+    cloud = _worker_cloud
+    try:
+        r = run_fit(cloud, center_method, fit_method, stats, polys=EllipsoidPolys(cloud, stats, polys=polys))
+        rel_std, mae = calimu.pcl_algo.err.get_err(cloud, r.xform)
+    except (np.linalg.LinAlgError, ValueError):
+        return None  # degenerate for this cloud, like a sphere fit on a flat one
+    return SweepResult(*r, rel_std, mae)
+
+
+def rank_results(results, top_k=None):
+    """Sort results best first, by the sum of their places in the relative std and MAE rankings.
+
+    A few outliers blow up the relative std of every fit, so ranking by it alone mostly measures how outliers land.
+    Ties go to the lower relative std, and results that came out as nan go last.
+    """
+    results = list(results)
+    if not results:
+        return results
+    rel = np.array([r.rel_std for r in results], dtype=np.float64)
+    mae = np.abs(np.array([r.mae for r in results], dtype=np.float64))
+    rel[np.isnan(rel)] = np.inf
+    mae[np.isnan(mae)] = np.inf
+    places = np.argsort(np.argsort(rel, kind="stable"), kind="stable") + np.argsort(
+        np.argsort(mae, kind="stable"), kind="stable"
+    )
+    order = np.lexsort((rel, places))
+    ranked = [results[i] for i in order]
+    return ranked if top_k is None else ranked[:top_k]
+
+
+def sweep(cloud, stats=None, centers=None, fits=None, processes=None, top_k=None):
+    """Run every center × fit combination on a process pool and return SweepResults, ranked by rank_results.
+
+    The cloud is copied once into shared memory, and every worker reads it from there instead of getting its own
+    pickled copy. The robust polynomials are computed once, on the pool, and shared by every combination using them.
+    Combinations that fail on this cloud are left out.
+
+    Args:
+        cloud: (N, 3) points
+        stats: the cloud's CloudStats, if they're already around
+        centers: center method names to try, defaults to all of CENTER_METHODS
+        fits: fit method names to try, defaults to all of FIT_METHODS
+        processes: size of the process pool, defaults to the number of CPUs
+        top_k: only return the best top_k results
+    """
+    cloud = np.ascontiguousarray(cloud)
+    centers = list(CENTER_METHODS) if centers is None else list(centers)
+    fits = list(FIT_METHODS) if fits is None else list(fits)
+    if stats is None:
+        stats = CloudStats()
+        stats.update(cloud)
+    combos = [(c, f) for c in centers for f in fits]
+    robust_kinds = {k for c, f in combos for k in (c, f) if k in _ROBUST}
+
+    shm = shared_memory.SharedMemory(create=True, size=max(cloud.nbytes, 1))
+    try:
+        np.ndarray(cloud.shape, dtype=cloud.dtype, buffer=shm.buf)[:] = cloud
+        with process_pool(
+            processes,
+            initializer=_init_worker,
+            initargs=(shm.name, cloud.shape, cloud.dtype.str),
+        ) as pool:
+            # everything that doesn't need a robust polynomial runs while those get computed
+            polys = {}
+            futures = [
+                pool.submit(_run_combo, c, f, stats, polys)
+                for c, f in combos
+                if c not in _ROBUST and f not in _ROBUST
+            ]
+            try:
+                if robust_kinds:
+                    polys["ransac"] = pool.submit(_robust_poly, "ransac").result()
+                if "irls" in robust_kinds:
+                    polys["irls"] = pool.submit(_robust_poly, "irls", polys["ransac"]).result()
+            except (np.linalg.LinAlgError, ValueError):
+                polys = None  # too few points for the robust fits
+            if polys is not None:
+                futures += [
+                    pool.submit(_run_combo, c, f, stats, polys)
+                    for c, f in combos
+                    if c in _ROBUST or f in _ROBUST
+                ]
+            results = [r for r in (f.result() for f in futures) if r is not None]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return rank_results(results, top_k)
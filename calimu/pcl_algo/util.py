@@ -1,8 +1,19 @@
 # Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
 
+import concurrent.futures
+import multiprocessing
+
 import numpy as np
 
 
+def process_pool(processes=None, **kwargs):
+    """A ProcessPoolExecutor of fresh, spawned processes. Forking would copy whatever threads, windows and open ports
+    the calling process has, like the GUI's Tk, VTK and gather threads."""
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes, mp_context=multiprocessing.get_context("spawn"), **kwargs
+    )
+
+
 def ls_ellipsoid(cloud):
     # from: https://stackoverflow.com/a/58532308
 
@@ -41,3 +52,60 @@ def ls_ellipsoid(cloud):
     sol = np.append(sol, -1)
 
     return sol
+
+
+def ellipsoid_design_matrix(cloud):
+    # the same N×9 matrix ls_ellipsoid builds: x^2, y^2, z^2, xy, xz, yz, x, y, z
+    cloud = np.asarray(cloud, dtype=np.float64)
+    x = cloud[:, 0]
+    y = cloud[:, 1]
+    z = cloud[:, 2]
+    return np.column_stack((x * x, y * y, z * z, x * y, x * z, y * z, x, y, z))
+
+
+def scaled_lstsq(ata, atb):
+    """Solve the normal equations ata @ x = atb with the columns scaled to 1 first.
+
+    The x^2 columns of a design matrix are ~1e4 times the x columns, so solving unscaled loses a lot of precision.
+    """
+    d = np.sqrt(np.diag(ata))
+    d[d == 0] = 1
+    return np.linalg.lstsq(ata / np.outer(d, d), atb / d, rcond=None)[0] / d
+
+
+class IncrementalEllipsoid(object):
+    """Running version of ls_ellipsoid.
+
+    Keeps the 9×9 JᵀJ and the Jᵀ1 sums of the least squares problem, so adding a batch only costs that batch, and
+    solve() only has to solve a 9×9 system no matter how many points went in.
+    """
+
+    def __init__(self):
+        self.jtj = np.zeros((9, 9))
+        self.jt1 = np.zeros(9)
+        self.count = 0
+
+    def reset(self):
+        self.jtj[...] = 0
+        self.jt1[...] = 0
+        self.count = 0
+
+    def update(self, cloud):
+        j = ellipsoid_design_matrix(cloud)
+        self.jtj += j.T @ j
+        self.jt1 += j.sum(axis=0)
+        self.count += j.shape[0]
+
+    def solve(self):
+        """Same output as ls_ellipsoid on every point passed to update() so far."""
+        return np.append(scaled_lstsq(self.jtj, self.jt1), -1)
+
+    def residual(self, poly=None):
+        """RMS of Ax^2 + ... + Iz - 1 over every point, computed from the sums alone."""
+        if self.count == 0:
+            return 0.0
+        if poly is None:
+            poly = self.solve()
+        p = poly[:9]
+        sq = p @ self.jtj @ p - 2 * p @ self.jt1 + self.count
+        return np.sqrt(max(sq, 0) / self.count)
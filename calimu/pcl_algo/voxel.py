@@ -0,0 +1,101 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+import itertools
+
+import numpy as np
+
+# voxel coordinates within ±2**20 get packed into one int64 key, 21 bits per axis. Ones further out are keyed by their
+# (x, y, z) tuple instead, which is slower but never collides with a packed key or another voxel.
+_BITS = 21
+_OFFSET = 1 << (_BITS - 1)
+_MASK = (1 << _BITS) - 1
+
+
+def _pack(v):
+    v = (v + _OFFSET) & _MASK
+    return (v[:, 0] << (2 * _BITS)) | (v[:, 1] << _BITS) | v[:, 2]
+
+
+class VoxelGrid(object):
+    """Sparse hashed voxel grid that keeps at most one point per voxel, used to gate points while gathering.
+
+    Voxels have an edge of min_distance, so holding the IMU still doesn't keep adding copies of the same point.
+    Inserts are amortized O(1) per point. Voxel coordinates are integers, so octree levels come for free by shifting
+    them: cells(depth) gives the occupied cells at any depth of the octree over the grid, for drawing.
+    """
+
+    def __init__(self, min_distance):
+        if min_distance <= 0:
+            raise ValueError("min_distance should be positive")
+        self.min_distance = float(min_distance)
+        self._occupied = set()
+        self._voxels = []  # int64 (k, 3) voxel coordinates of every occupied voxel, in batches
+        self._voxel_cache = None
+
+    def __len__(self):
+        return len(self._occupied)
+
+    def clear(self):
+        self._occupied = set()
+        self._voxels = []
+        self._voxel_cache = None
+
+    def insert(self, points):
+        """Add the points that land in empty voxels. Returns a boolean mask of the ones that were added."""
+        points = np.asarray(points)
+        mask = np.zeros(points.shape[0], dtype=bool)
+        if points.shape[0] == 0:
+            return mask
+        v = np.floor(points / self.min_distance).astype(np.int64)
+        packable = np.all((v >= -_OFFSET) & (v < _OFFSET), axis=1)
+
+        # first point of each voxel in the batch, then only the voxels the grid hasn't seen yet
+        if np.all(packable):
+            uniq, first = np.unique(_pack(v), return_index=True)
+            keys = uniq.tolist()
+        else:
+            packed = np.flatnonzero(packable)
+            far = np.flatnonzero(~packable)
+            uniq, first = np.unique(_pack(v[packed]), return_index=True)
+            far_uniq, far_first = np.unique(v[far], axis=0, return_index=True)
+            keys = uniq.tolist() + list(map(tuple, far_uniq.tolist()))
+            first = np.concatenate((packed[first], far[far_first]))
+        occupied = self._occupied
+        new = np.fromiter((k not in occupied for k in keys), dtype=bool, count=len(keys))
+        occupied.update(itertools.compress(keys, new.tolist()))
+
+        mask[first[new]] = True
+        if np.any(new):
+            self._voxels.append(v[mask])
+            self._voxel_cache = None
+        return mask
+
+    def voxels(self):
+        """(k, 3) integer coordinates of every occupied voxel."""
+        if self._voxel_cache is None:
+            self._voxel_cache = np.concatenate(self._voxels) if self._voxels else np.zeros((0, 3), np.int64)
+            self._voxels = [self._voxel_cache]
+        return self._voxel_cache
+
+    def _octree_root(self):
+        # the octree is rooted at the low corner of the occupied voxels, so it doesn't matter where zero is
+        v = self.voxels()
+        if v.shape[0] == 0:
+            return np.zeros(3, np.int64), 0
+        lo = v.min(axis=0)
+        extent = int(np.max(v.max(axis=0) - lo)) + 1
+        return lo, (extent - 1).bit_length()
+
+    def depth(self):
+        """Depth of the octree: the root at depth 0 is one cell holding everything, and this depth is the voxels."""
+        return self._octree_root()[1]
+
+    def cells(self, depth=None):
+        """Centers and edge length of the occupied octree cells at a depth. Defaults to the voxels themselves."""
+        lo, full_depth = self._octree_root()
+        if depth is None or depth > full_depth:
+            depth = full_depth
+        shift = full_depth - max(depth, 0)
+        cells = np.unique((self.voxels() - lo) >> shift, axis=0)
+        size = self.min_distance * (1 << shift)
+        return lo * self.min_distance + (cells + 0.5) * size, size
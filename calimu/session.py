@@ -0,0 +1,143 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+"""Calibration without the GUI: gather or load point clouds, fit them and upload the result.
+
+Nothing here imports tkinter or vtk, so it works on machines without a display.
+"""
+
+import os
+import time
+
+import numpy as np
+
+import calimu.pcl_algo.err
+from calimu.imu.buffer import PointBuffer
+from calimu.imu.devices.mc6470 import MC6470IMU
+from calimu.pcl_algo.pipeline import run_fit
+from calimu.pcl_algo.stats import CloudStats
+from calimu.pcl_algo.sweep import sweep
+from calimu.pcl_algo.voxel import VoxelGrid
+
+SENSORS = ("m", "a")
+
+
+def load_cloud(path):
+    """Load an (N, 3) point cloud from a .npy file, or from a csv/txt file with one x,y,z row per point.
+
+    Header rows, comments and rows that don't parse are skipped.
+    """
+    if os.path.splitext(path)[1].lower() == ".npy":
+        cloud = np.load(path)
+    else:
+        cloud = np.genfromtxt(path, delimiter="," if path.lower().endswith(".csv") else None, comments="#")
+        cloud = np.atleast_2d(cloud)
+        cloud = cloud[~np.any(np.isnan(cloud), axis=1)]
+    if cloud.ndim != 2 or cloud.shape[1] != 3:
+        raise ValueError(f"{path} should hold (N, 3) points, got an array of shape {cloud.shape}")
+    return cloud
+
+
+def save_cloud(path, cloud):
+    """Save an (N, 3) point cloud as .npy, or as csv/txt for anything else."""
+    if os.path.splitext(path)[1].lower() == ".npy":
+        np.save(path, np.asarray(cloud))
+    else:
+        np.savetxt(path, np.asarray(cloud), delimiter="," if path.lower().endswith(".csv") else " ", fmt="%.9g")
+
+
+class CalibrationSession(object):
+    """Headless version of what the GUI does: collect points per sensor, fit them, and upload the offsets.
+
+    Points either come from an IMU with gather() or from files with load(). Sensors are "m" for the magnetometer and
+    "a" for the accelerometer, like in IMUPointStore.
+    """
+
+    def __init__(self, imu=None, min_distance=None):
+        self.imu = imu
+        self.points = {t: PointBuffer(np.float64) for t in SENSORS}
+        self.stats = {t: CloudStats() for t in SENSORS}
+        self.voxels = {t: VoxelGrid(min_distance) if min_distance else None for t in SENSORS}
+
+    @classmethod
+    def connect(cls, port, baud=None, binary=False, min_distance=None, **kwargs):
+        """Start a session with an MC6470 on a serial port."""
+        if baud is None:
+            baud = MC6470IMU.DEFAULT_BAUDRATE
+        return cls(MC6470IMU(port, baud, binary=binary, **kwargs), min_distance)
+
+    def add_points(self, sensor, points):
+        """Add points to a sensor's cloud, minus any the min_distance gate rejects. Returns how many were added."""
+        points = np.asarray(points).reshape(-1, 3)
+        if self.voxels[sensor] is not None:
+            points = points[self.voxels[sensor].insert(points)]
+        self.points[sensor].append(points)
+        self.stats[sensor].update(points)
+        return points.shape[0]
+
+    def clear(self, sensor):
+        self.points[sensor].clear()
+        self.stats[sensor].reset()
+        if self.voxels[sensor] is not None:
+            self.voxels[sensor].clear()
+
+    def load(self, path, sensor="m"):
+        return self.add_points(sensor, load_cloud(path))
+
+    def save(self, path, sensor="m"):
+        save_cloud(path, self.points[sensor].view())
+
+    def gather(self, duration=None, samples=None, sensors=SENSORS, on_batch=None):
+        """Gather points from the IMU until duration seconds pass or every sensor in sensors has samples points.
+
+        on_batch(session) is called after every batch, for progress output. Returns the point count per sensor.
+        """
+        if duration is None and samples is None:
+            raise ValueError("gather needs a duration, a sample count, or both")
+        if self.imu is None or self.imu.connection is None:
+            raise RuntimeError("IMU should be connected to gather points.")
+
+        t_end = None if duration is None else time.time() + duration
+        batches = self.imu.mag_accel_batch_iter()
+        try:
+            for batch in batches:
+                for t in sensors:
+                    if t in batch and batch[t].shape[0]:
+                        self.add_points(t, batch[t])
+                if on_batch is not None:
+                    on_batch(self)
+                if t_end is not None and time.time() >= t_end:
+                    break
+                if samples is not None and all(len(self.points[t]) >= samples for t in sensors):
+                    break
+        finally:
+            batches.close()  # stops the sensor loops on the device
+        return {t: len(self.points[t]) for t in sensors}
+
+    def fit(self, sensor="m", center="ellipsoid", fit="ellipsoid", processes=None):
+        """Fit a sensor's cloud with center and fit methods named as in calimu.pcl_algo.pipeline, as a FitResult."""
+        return run_fit(self.points[sensor].view(), center, fit, self.stats[sensor].copy(), processes)
+
+    def error(self, sensor, result):
+        """(rel_std, mae) of a fit against a sensor's current cloud."""
+        return calimu.pcl_algo.err.get_err(self.points[sensor].view(), result.xform)
+
+    def fit_all(self, sensor="m", top_k=None, processes=None):
+        """Every center × fit combination, ranked best first. See calimu.pcl_algo.sweep."""
+        return sweep(self.points[sensor].view(), self.stats[sensor].copy(), processes=processes, top_k=top_k)
+
+    def upload(self, sensor, result):
+        """Send a fit's offsets to the IMU."""
+        if self.imu is None:
+            raise RuntimeError("IMU should be connected to set offsets.")
+        if sensor == "m":
+            self.imu.set_magnetometer_offsets(result.xform, result.avg_scale)
+        elif sensor == "a":
+            self.imu.set_accelerometer_offsets(result.xform, result.avg_scale)
+        else:
+            raise ValueError(f"Unknown sensor {sensor!r}")
+        # anything still buffered was measured with the old offsets, and shouldn't end up in the next gather
+        self.imu.connection.reset_input_buffer()
+
+    def close(self):
+        if self.imu is not None and self.imu.connection is not None:
+            self.imu.disconnect()
@@ -21,16 +21,19 @@ setup(
     name="calimu",
     version="0.1.0",
     description="A tool for calibrating IMUs",
-    python_requires="==3.*,>=3.7.0",
+    python_requires="==3.*,>=3.8.0",
     project_urls={"repository": "https://github.com/simleek/displayarray"},
     author="SimLeek",
     author_email="simulator.leek@gmail.com",
     license="MIT",
-    entry_points={"console_scripts": ["calimu = calimu.gui:main"]},
+    entry_points={
+        "console_scripts": ["calimu = calimu.gui:main", "calimu-fit = calimu.cli:main"]
+    },
     packages=[
         "calimu",
         "calimu.imu",
         "calimu.imu.devices",
+        "calimu.imu.urlhandler",
         "calimu.pcl_algo",
     ],
     package_dir={"": "."},
@@ -38,7 +41,6 @@ setup(
     install_requires=[
         "numpy>=1.23.1",
         "pyserial>=3.5",
-        "scikit_learn>=1.1.2",
         "svtk>=0.2.0",
         "vtk>=9.1.0",
     ],
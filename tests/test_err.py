@@ -0,0 +1,60 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+import numpy as np
+import pytest
+
+from calimu.pcl_algo.err import get_err, residuals
+
+
+def _baseline_err(cloud, xform):
+    # the original, unchunked get_err
+    xform_inv = np.linalg.inv(xform)
+    b = np.ones((cloud.shape[0], 4))
+    b[:, :-1] = cloud
+    r = np.linalg.norm(np.dot(b, xform_inv.T)[:, :-1], axis=1)
+    rel_dist = r - 1
+    rel_dist[rel_dist < 0] = -1 / (rel_dist[rel_dist < 0] + 1) + 1
+    return np.std(rel_dist + 1), np.sum(np.abs(rel_dist)) / r.shape[0]
+
+
+def _cloud(n, seed=3):
+    rng = np.random.default_rng(seed)
+    v = rng.normal(size=(n, 3))
+    v /= np.linalg.norm(v, axis=1)[:, np.newaxis]
+    v *= 1 + rng.normal(scale=0.05, size=(n, 1))
+    xform = np.array(
+        [
+            [400.0, 20.0, 0.0, 12.0],
+            [0.0, 300.0, 15.0, -40.0],
+            [5.0, 0.0, 250.0, 7.0],
+            [0.0, 0.0, 0.0, 1.0],
+        ]
+    )
+    return v @ xform[:3, :3].T + xform[:3, 3], xform
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1000, 65536])
+def test_matches_baseline(chunk_size):
+    cloud, xform = _cloud(5000)
+    np.testing.assert_allclose(get_err(cloud, xform, chunk_size=chunk_size), _baseline_err(cloud, xform), rtol=1e-9)
+
+
+def test_float32_is_close():
+    cloud, xform = _cloud(5000)
+    np.testing.assert_allclose(get_err(cloud, xform, dtype=np.float32), _baseline_err(cloud, xform), rtol=1e-4)
+
+
+def test_int_cloud():
+    cloud, xform = _cloud(2000)
+    cloud = np.round(cloud).astype(np.int16)
+    np.testing.assert_allclose(get_err(cloud, xform), _baseline_err(cloud.astype(np.float64), xform), rtol=1e-9)
+
+
+def test_empty_cloud():
+    rel_std, mae = get_err(np.zeros((0, 3)), np.eye(4))
+    assert np.isnan(rel_std) and np.isnan(mae)
+
+
+def test_residuals_are_signed():
+    r = residuals(np.array([[2.0, 0, 0], [0.5, 0, 0], [0, 1.0, 0]]), np.eye(4), dtype=np.float64)
+    np.testing.assert_allclose(r, [1.0, -1.0, 0.0])
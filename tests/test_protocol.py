@@ -0,0 +1,104 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+import numpy as np
+
+from calimu.imu.protocol import (
+    FRAME_DTYPE,
+    FRAME_SIZE,
+    FRAME_SYNC,
+    FrameDecoder,
+    _CRC_END,
+    _CRC_START,
+    crc16,
+    decode_frames,
+    encode_frames,
+)
+
+
+def _xyz(n):
+    return np.arange(n * 3, dtype=np.int16).reshape(n, 3)
+
+
+def test_round_trip():
+    data = encode_frames(list("mama"), _xyz(4))
+    frames, rest, skipped = decode_frames(data)
+    assert frames.shape[0] == 4
+    assert bytes(frames["tag"]) == b"mama"
+    np.testing.assert_array_equal(frames["xyz"], _xyz(4))
+    assert rest == b""
+    assert skipped == 0
+
+
+def test_crc_matches_ccitt_false():
+    # the standard check value of CRC-16/CCITT-FALSE
+    assert int(crc16(np.frombuffer(b"123456789", dtype=np.uint8))[0]) == 0x29B1
+
+
+def test_resyncs_after_garbage():
+    data = b"\x00\x5a\xa5junk" + encode_frames("m", _xyz(2)) + b"\xff" * 3 + encode_frames("a", _xyz(1))
+    frames, rest, skipped = decode_frames(data)
+    assert bytes(frames["tag"]) == b"mma"
+    assert skipped == 7 + 3
+
+
+def test_corrupt_frame_is_skipped():
+    data = bytearray(encode_frames("m", _xyz(3)))
+    data[FRAME_SIZE + 6] ^= 0xFF  # a payload byte of the middle frame
+    frames, _, skipped = decode_frames(bytes(data))
+    np.testing.assert_array_equal(frames["seq"], [0, 2])
+    assert skipped == FRAME_SIZE
+
+
+def test_partial_frame_is_kept():
+    data = encode_frames("m", _xyz(2))
+    frames, rest, _ = decode_frames(data[:-4])
+    assert frames.shape[0] == 1
+    assert rest == data[FRAME_SIZE:-4]
+
+    decoder = FrameDecoder()
+    out = [decoder.feed(data[i : i + 5]) for i in range(0, len(data), 5)]
+    assert sum(f.shape[0] for f in out) == 2
+    assert decoder.skipped_bytes == 0
+
+
+def test_crc_colliding_false_start_doesnt_drop_the_next_frame():
+    # frame 0's x holds the sync word, so a false start sits at byte 5. Frame 1's seq is picked to be the crc of the
+    # bytes that false frame covers, making it pass the crc check.
+    first = np.zeros(1, dtype=FRAME_DTYPE)
+    first["sync"] = FRAME_SYNC
+    first["tag"] = ord("m")
+    first["xyz"] = [np.int16(np.uint16(FRAME_SYNC).view(np.int16)), 7, 9]
+    raw = first.view(np.uint8)
+    first["crc"] = crc16(raw[_CRC_START:_CRC_END])
+    head = first.tobytes() + encode_frames("a", [[0, 0, 0]])[:3]
+
+    false_start = 5
+    fake = np.frombuffer(head[false_start:] + b"\0\0", dtype=np.uint8)
+    fake_crc = int(crc16(fake[_CRC_START:_CRC_END])[0])
+    data = first.tobytes() + encode_frames("a", [[1, 2, 3]], seq=[fake_crc])
+
+    frames, _, _ = decode_frames(data)
+    assert bytes(frames["tag"]) == b"ma"
+    np.testing.assert_array_equal(frames["xyz"][1], [1, 2, 3])
+
+
+def test_dropped_frames_count_gaps():
+    decoder = FrameDecoder()
+    decoder.feed(encode_frames("m", _xyz(3), seq=[0, 1, 4]))
+    decoder.feed(encode_frames("m", _xyz(1), seq=[6]))
+    assert decoder.dropped_frames == 2 + 1
+
+
+def test_seq_wraps_without_drops():
+    decoder = FrameDecoder()
+    decoder.feed(encode_frames("m", _xyz(4), seq=[65534, 65535, 0, 1]))
+    assert decoder.dropped_frames == 0
+
+
+def test_repeats_and_restarts_resync():
+    decoder = FrameDecoder()
+    decoder.feed(encode_frames("m", _xyz(3), seq=[100, 101, 101]))
+    assert decoder.dropped_frames == 0
+    decoder.feed(encode_frames("m", _xyz(3), seq=[0, 1, 3]))  # the device restarted
+    assert decoder.dropped_frames == 1
+    assert decoder.frames == 6
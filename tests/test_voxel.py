@@ -0,0 +1,28 @@
+# Copyright (C) 2022 - Simleek <simulatorleek@gmail.com> - MIT License
+
+import numpy as np
+
+from calimu.pcl_algo.voxel import VoxelGrid
+
+
+def test_one_point_per_voxel():
+    grid = VoxelGrid(1.0)
+    mask = grid.insert([[0.1, 0.1, 0.1], [0.9, 0.5, 0.2], [1.1, 0, 0], [-0.1, 0, 0]])
+    np.testing.assert_array_equal(mask, [True, False, True, True])
+    np.testing.assert_array_equal(grid.insert([[0.5, 0.5, 0.5], [2.5, 0, 0]]), [False, True])
+    assert len(grid) == 4
+
+
+def test_far_voxels_dont_wrap_onto_near_ones():
+    grid = VoxelGrid(0.01)
+    np.testing.assert_array_equal(grid.insert([[0, 0, 0], [2 ** 21 * 0.01 + 0.001, 0, 0]]), [True, True])
+    np.testing.assert_array_equal(grid.insert([[2 ** 21 * 0.01 + 0.002, 0, 0], [0, -2 ** 22 * 0.01, 0]]), [False, True])
+    assert len(grid) == 3
+    assert grid.voxels().shape == (3, 3)
+
+
+def test_clear():
+    grid = VoxelGrid(1.0)
+    grid.insert([[0, 0, 0]])
+    grid.clear()
+    np.testing.assert_array_equal(grid.insert([[0, 0, 0]]), [True])